@@ -0,0 +1,118 @@
+"""Throughput of the multi-worker mode versus worker count
+
+Runs the same routing and IPC as the bot's front process (services.cluster)
+against worker processes that do the CPU-bound part of handling a command
+result: MarkdownV2 escaping, formatting and truncation of a large output.
+SSH and Telegram are left out so the numbers show how the CPU work scales.
+
+Usage:
+    python benchmarks/shard_throughput.py [--workers 1 2 4] [--updates 4000] [--output-kb 32]
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.cluster import (
+    connect_worker_processes, read_frame, remove_socket_directory, shard_for,
+    start_worker_processes, stop_worker_processes, write_frame
+)
+from utils.helpers import format_command_output, truncate_text
+
+def bench_worker(index: int, path: str):
+    """Worker: format the command output carried by each update, then ack it"""
+    asyncio.run(_bench_worker_main(path))
+
+async def _bench_worker_main(path: str):
+    done = asyncio.Event()
+
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                update = json.loads(await read_frame(reader))
+                message = update['message']
+                truncate_text(format_command_output(message['text'], message['output'], True))
+                await write_frame(writer, str(update['update_id']).encode())
+        except asyncio.IncompleteReadError:
+            pass
+        finally:
+            writer.close()
+            done.set()
+
+    server = await asyncio.start_unix_server(handle, path=path)
+    os.chmod(path, 0o600)
+    await done.wait()
+    server.close()
+    os.remove(path)
+
+def make_updates(count: int, users: int, output_kb: int) -> list:
+    line = "drwxr-xr-x 2 root root 4096 Jan 1 00:00 some_dir.name-[1]_(x)!\n"
+    output = (line * (output_kb * 1024 // len(line) + 1))[:output_kb * 1024]
+    return [
+        json.dumps({
+            'update_id': update_id,
+            'message': {
+                'from': {'id': random.randint(1, users)},
+                'text': 'ls -la /var/lib',
+                'output': output,
+            },
+        }).encode()
+        for update_id in range(count)
+    ]
+
+async def run(workers: int, updates: list) -> float:
+    processes = start_worker_processes(bench_worker, workers)
+    connections = await connect_worker_processes(processes)
+
+    async def collect_acks(reader: asyncio.StreamReader, expected: int):
+        for _ in range(expected):
+            await read_frame(reader)
+
+    routed = [[] for _ in range(workers)]
+    for payload in updates:
+        routed[shard_for(json.loads(payload)['message']['from']['id'], workers)].append(payload)
+
+    try:
+        started = time.perf_counter()
+        acks = [
+            asyncio.create_task(collect_acks(reader, len(routed[index])))
+            for index, (reader, _) in enumerate(connections)
+        ]
+        for index, (_, writer) in enumerate(connections):
+            for payload in routed[index]:
+                await write_frame(writer, payload)
+        await asyncio.gather(*acks)
+        elapsed = time.perf_counter() - started
+    finally:
+        for _, writer in connections:
+            writer.close()
+        await asyncio.to_thread(stop_worker_processes, processes)
+    return len(updates) / elapsed
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--updates', type=int, default=4000)
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--output-kb', type=int, default=32)
+    args = parser.parse_args()
+
+    updates = make_updates(args.updates, args.users, args.output_kb)
+    print(f"{args.updates} updates from {args.users} users, {args.output_kb} KB output each, {os.cpu_count()} CPUs")
+
+    baseline = None
+    try:
+        for workers in args.workers:
+            throughput = await run(workers, updates)
+            baseline = baseline or throughput
+            print(f"workers={workers:<3} {throughput:10.1f} updates/s  x{throughput / baseline:.2f}")
+    finally:
+        remove_socket_directory()
+
+if __name__ == '__main__':
+    asyncio.run(main())
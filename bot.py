@@ -1,45 +1,94 @@
 import asyncio
 import logging
+import os
+import queue
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
 from aiogram import Bot, Dispatcher
 from aiogram.fsm.storage.memory import MemoryStorage
 
 from config.config import config
 from handlers.start import router as start_router
+from handlers.admin import router as admin_router
 from handlers.commands import router as commands_router
 from handlers.terminal import router as terminal_router
+from middlewares.access import access_middleware
+from middlewares.profiling import handler_timing_middleware, telegram_request_timer
+from services.audit import audit_log
 from services.ssh_client import ssh_client
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('bot.log'),
-        logging.StreamHandler()
-    ]
-)
+def setup_logging() -> QueueListener:
+    """Configure logging and start the listener thread
+    
+    The event loop only enqueues records, file and console output happen
+    in the listener thread.
+    """
+    log_formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    
+    # Worker processes rotate their own files, RotatingFileHandler is not multi-process safe
+    log_file = config.LOG_FILE
+    if config.WORKER_ID:
+        log_root, log_ext = os.path.splitext(log_file)
+        log_file = f"{log_root}-{config.WORKER_ID}{log_ext}"
+    
+    file_handler = RotatingFileHandler(
+        log_file,
+        maxBytes=config.LOG_MAX_BYTES,
+        backupCount=config.LOG_BACKUP_COUNT
+    )
+    stream_handler = logging.StreamHandler()
+    for handler in (file_handler, stream_handler):
+        handler.setFormatter(log_formatter)
+    
+    log_queue = queue.SimpleQueue()
+    log_listener = QueueListener(log_queue, file_handler, stream_handler)
+    
+    # The queue only carries the message, the listener's handlers add the rest
+    queue_handler = QueueHandler(log_queue)
+    queue_handler.setFormatter(logging.Formatter('%(message)s'))
+    
+    logging.basicConfig(
+        level=logging.INFO,
+        handlers=[queue_handler]
+    )
+    
+    log_listener.start()
+    return log_listener
 
 logger = logging.getLogger(__name__)
 
-async def main():
-    """Main function"""
-    # Validate configuration
-    try:
-        config.validate()
-    except ValueError as e:
-        logger.error(f"Configuration error: {e}")
-        return
-    
-    # Initialize bot and dispatcher
+def create_bot() -> Bot:
+    """Create bot with Telegram API request timing for /profile"""
     bot = Bot(token=config.BOT_TOKEN)
+    bot.session.middleware(telegram_request_timer)
+    return bot
+
+def create_dispatcher() -> Dispatcher:
+    """Create dispatcher with middlewares and routers"""
     storage = MemoryStorage()
     dp = Dispatcher(storage=storage)
     
+    # Reject unauthorized, duplicate and flooding updates before any handler runs
+    dp.message.outer_middleware(access_middleware)
+    dp.callback_query.outer_middleware(access_middleware)
+    dp.inline_query.outer_middleware(access_middleware)
+    
+    # Per-handler timings for /profile, a no-op while the profiler is off
+    dp.message.middleware(handler_timing_middleware)
+    dp.callback_query.middleware(handler_timing_middleware)
+    dp.inline_query.middleware(handler_timing_middleware)
+    
     # Include routers
     dp.include_router(start_router)
+    dp.include_router(admin_router)
     dp.include_router(terminal_router)
     dp.include_router(commands_router)
     
+    return dp
+
+async def start_services():
+    """Start background services and test the SSH connection"""
+    audit_log.start()
+    
     # Test SSH connection on startup
     try:
         logger.info("Testing SSH connection...")
@@ -50,6 +99,39 @@ async def main():
             logger.error("SSH connection test failed")
     except Exception as e:
         logger.error(f"SSH connection test error: {e}")
+
+async def stop_services(bot: Bot):
+    """Close SSH sessions, the bot session and flush the audit log"""
+    await ssh_client.close_all_sessions()
+    await bot.session.close()
+    audit_log.stop()
+
+async def main():
+    """Main function"""
+    log_listener = setup_logging()
+    
+    # Validate configuration
+    try:
+        config.validate()
+    except ValueError as e:
+        logger.error(f"Configuration error: {e}")
+        log_listener.stop()
+        return
+    
+    if config.WORKERS > 1:
+        # Front process: receive updates by webhook and route them to workers
+        from services.cluster import run_front
+        try:
+            await run_front()
+        finally:
+            log_listener.stop()
+        return
+    
+    # Initialize bot and dispatcher
+    bot = create_bot()
+    dp = create_dispatcher()
+    
+    await start_services()
     
     # Start polling
     try:
@@ -59,8 +141,8 @@ async def main():
         logger.error(f"Bot error: {e}")
     finally:
         # Cleanup
-        await ssh_client.close_all_sessions()
-        await bot.session.close()
+        await stop_services(bot)
+        log_listener.stop()
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    asyncio.run(main())
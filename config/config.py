@@ -12,12 +12,52 @@ class Config:
     SSH_USERNAME: str = os.getenv('SSH_USERNAME', 'root')
     SSH_PASSWORD: str = os.getenv('SSH_PASSWORD', '')
     SSH_KEY_PATH: str = os.getenv('SSH_KEY_PATH', '')
-    ADMIN_IDS: list = None
+    SSH_COMPRESSION: bool = os.getenv('SSH_COMPRESSION', 'true').lower() in ('1', 'true', 'yes')
+    ADMIN_IDS: frozenset = None
+    LOG_FILE: str = os.getenv('LOG_FILE', 'bot.log')
+    LOG_MAX_BYTES: int = int(os.getenv('LOG_MAX_BYTES', 10 * 1024 * 1024))
+    LOG_BACKUP_COUNT: int = int(os.getenv('LOG_BACKUP_COUNT', 5))
+    AUDIT_DIR: str = os.getenv('AUDIT_DIR', 'logs/audit')
+    AUDIT_MAX_BYTES: int = int(os.getenv('AUDIT_MAX_BYTES', 10 * 1024 * 1024))
+    AUDIT_ROTATE_SECONDS: int = int(os.getenv('AUDIT_ROTATE_SECONDS', 24 * 60 * 60))
+    AUDIT_BACKUP_COUNT: int = int(os.getenv('AUDIT_BACKUP_COUNT', 30))
+    AUDIT_FSYNC_INTERVAL: float = float(os.getenv('AUDIT_FSYNC_INTERVAL', 1.0))
+    RATE_LIMIT_PER_SECOND: float = float(os.getenv('RATE_LIMIT_PER_SECOND', 1.0))
+    RATE_LIMIT_BURST: int = int(os.getenv('RATE_LIMIT_BURST', 5))
+    DUPLICATE_WINDOW: float = float(os.getenv('DUPLICATE_WINDOW', 2.0))
+    LARGE_OUTPUT_THRESHOLD: int = int(os.getenv('LARGE_OUTPUT_THRESHOLD', 3500))
+    OUTPUT_HEAD_BYTES: int = int(os.getenv('OUTPUT_HEAD_BYTES', 2048))
+    OUTPUT_TAIL_BYTES: int = int(os.getenv('OUTPUT_TAIL_BYTES', 1536))
+    OUTPUT_LIMIT_BYTES: int = int(os.getenv('OUTPUT_LIMIT_BYTES', 8 * 1024 * 1024))
+    HISTORY_MAX_ENTRIES: int = int(os.getenv('HISTORY_MAX_ENTRIES', 200))
+    HISTORY_MAX_BYTES: int = int(os.getenv('HISTORY_MAX_BYTES', 1024 * 1024))
+    COMPLETION_TTL: float = float(os.getenv('COMPLETION_TTL', 300))
+    COMPLETION_MAX_DIRECTORIES: int = int(os.getenv('COMPLETION_MAX_DIRECTORIES', 256))
+    COMPLETION_MAX_ENTRIES: int = int(os.getenv('COMPLETION_MAX_ENTRIES', 5000))
+    PROFILE_SAMPLE_INTERVAL: float = float(os.getenv('PROFILE_SAMPLE_INTERVAL', 0.005))
+    PROFILE_SLOW_THRESHOLD: float = float(os.getenv('PROFILE_SLOW_THRESHOLD', 0.1))
+    PROFILE_MAX_SECONDS: int = int(os.getenv('PROFILE_MAX_SECONDS', 600))
+    WORKERS: int = int(os.getenv('WORKERS', 1))
+    WORKER_ID: str = os.getenv('WORKER_ID', '')
+    WEBHOOK_URL: str = os.getenv('WEBHOOK_URL', '')
+    WEBHOOK_PATH: str = os.getenv('WEBHOOK_PATH', '/webhook')
+    WEBHOOK_HOST: str = os.getenv('WEBHOOK_HOST', '0.0.0.0')
+    WEBHOOK_PORT: int = int(os.getenv('WEBHOOK_PORT', 8080))
+    WEBHOOK_SECRET: str = os.getenv('WEBHOOK_SECRET', '')
+    IPC_SOCKET_DIR: str = os.getenv('IPC_SOCKET_DIR', '')
+    QUICK_COMMANDS_FILE: str = os.getenv(
+        'QUICK_COMMANDS_FILE',
+        os.path.join(os.path.dirname(__file__), 'quick_commands.json')
+    )
+    POLICY_FILE: str = os.getenv(
+        'POLICY_FILE',
+        os.path.join(os.path.dirname(__file__), 'policy.json')
+    )
     
     def __post_init__(self):
         if self.ADMIN_IDS is None:
             admin_ids = os.getenv('ADMIN_IDS', '')
-            self.ADMIN_IDS = [int(id.strip()) for id in admin_ids.split(',') if id.strip()]
+            self.ADMIN_IDS = frozenset(int(id.strip()) for id in admin_ids.split(',') if id.strip())
     
     def validate(self):
         """Validate configuration"""
@@ -29,5 +69,9 @@ class Config:
             raise ValueError("SSH_USERNAME is required")
         if not self.SSH_PASSWORD and not self.SSH_KEY_PATH:
             raise ValueError("Either SSH_PASSWORD or SSH_KEY_PATH is required")
+        if not self.ADMIN_IDS:
+            raise ValueError("ADMIN_IDS is required")
+        if self.WORKERS > 1 and not self.WEBHOOK_URL:
+            raise ValueError("WEBHOOK_URL is required when WORKERS > 1")
 
 config = Config()
\ No newline at end of file
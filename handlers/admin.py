@@ -0,0 +1,156 @@
+import asyncio
+import os
+import re
+import time
+from aiogram import Router, types
+from aiogram.filters import Command, CommandObject
+from dateutil import parser as date_parser
+from config.config import config
+from services.audit import audit_log
+from services.profiler import profiler, write_report
+from utils.helpers import truncate_text
+import logging
+
+logger = logging.getLogger(__name__)
+
+router = Router()
+
+RELATIVE_TIME_UNITS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400, 'w': 604800}
+PROFILE_DEFAULT_SECONDS = 60
+
+# Auto-stop of the running /profile, cancelled by a manual stop
+profile_stop_task = None
+
+def parse_since(value: str) -> float:
+    """Parse '30m', '2h', '1d' or an absolute date into a unix timestamp"""
+    match = re.fullmatch(r'(\d+)([smhdw])', value)
+    if match:
+        return time.time() - int(match.group(1)) * RELATIVE_TIME_UNITS[match.group(2)]
+    return date_parser.parse(value).timestamp()
+
+def format_audit_record(record: dict) -> str:
+    """Format one audit record as two plain text lines"""
+    status = "⏱" if record.get('exit_status') is None else ("✅" if record['exit_status'] == 0 else f"❌ {record['exit_status']}")
+    location = f" ({record['cwd']})" if record.get('cwd') else ""
+    return (
+        f"{record.get('time', '')} · {record.get('user_id')} · {status} · "
+        f"{record.get('duration', 0):.2f}s · {record.get('output_size', 0)} B\n"
+        f"$ {record.get('command', '')}{location}"
+    )
+
+@router.message(Command("audit"))
+async def cmd_audit(message: types.Message, command: CommandObject):
+    """Handle /audit [user=<id>] [since=<2h|2024-01-31>] [limit=<n>]"""
+    if message.from_user.id not in config.ADMIN_IDS:
+        await message.answer("🚫 Access denied.")
+        return
+
+    user_id = None
+    since = None
+    limit = 20
+
+    try:
+        for arg in (command.args or '').split():
+            key, _, value = arg.partition('=')
+            if key == 'user':
+                user_id = int(value)
+            elif key == 'since':
+                since = parse_since(value)
+            elif key == 'limit':
+                limit = max(1, min(int(value), 100))
+            else:
+                raise ValueError(f"unknown filter '{key}'")
+    except (ValueError, OverflowError) as e:
+        await message.answer(
+            f"❌ Invalid filter: {e}\n\nUsage: /audit user=<id> since=<2h|2024-01-31> limit=<n>"
+        )
+        return
+
+    records = await asyncio.to_thread(audit_log.query, user_id, since, limit)
+
+    if not records:
+        await message.answer("📜 No audit records found.")
+        return
+
+    text = "📜 Audit log (newest first)\n\n" + "\n\n".join(format_audit_record(record) for record in records)
+    await message.answer(truncate_text(text))
+
+async def send_profile_report(message: types.Message):
+    """Stop the profiler and send the report and folded stacks as files"""
+    window = profiler.stop()
+    if window is None:
+        await message.answer("⏹ Profiler is not running.")
+        return
+
+    report_path, folded_path = await asyncio.to_thread(
+        write_report, window, profiler.sample_interval, profiler.slow_threshold
+    )
+    try:
+        await message.answer_document(
+            types.FSInputFile(report_path),
+            caption=f"📈 Profile: {window.sample_count} samples, max loop lag {window.lag.max * 1000:.0f}ms"
+        )
+        await message.answer_document(
+            types.FSInputFile(folded_path),
+            caption="🔥 Folded stacks for flamegraph.pl or speedscope"
+        )
+    finally:
+        for path in (report_path, folded_path):
+            os.remove(path)
+
+async def stop_profile_later(message: types.Message, seconds: int):
+    """Stop the profiler after the requested duration"""
+    global profile_stop_task
+    await asyncio.sleep(seconds)
+    profile_stop_task = None
+    try:
+        await send_profile_report(message)
+    except Exception as e:
+        logger.error(f"Failed to send profile report: {e}")
+
+@router.message(Command("profile"))
+async def cmd_profile(message: types.Message, command: CommandObject):
+    """Handle /profile start [seconds] | stop | status"""
+    global profile_stop_task
+    if message.from_user.id not in config.ADMIN_IDS:
+        await message.answer("🚫 Access denied.")
+        return
+
+    args = (command.args or '').split()
+    action = args[0] if args else 'status'
+
+    if action == 'start':
+        try:
+            seconds = int(args[1]) if len(args) > 1 else PROFILE_DEFAULT_SECONDS
+        except ValueError:
+            await message.answer("❌ Usage: /profile start [seconds]")
+            return
+        seconds = max(1, min(seconds, config.PROFILE_MAX_SECONDS))
+
+        if not profiler.start():
+            await message.answer("⚠️ Profiler is already running, /profile stop to get the report.")
+            return
+
+        profile_stop_task = asyncio.create_task(stop_profile_later(message, seconds))
+        logger.info(f"Profiling started by user {message.from_user.id} for {seconds}s")
+        await message.answer(f"▶️ Profiling for {seconds}s, /profile stop to finish early.")
+
+    elif action == 'stop':
+        if profile_stop_task is not None:
+            profile_stop_task.cancel()
+            profile_stop_task = None
+        await send_profile_report(message)
+
+    elif action == 'status':
+        window = profiler.window
+        if window is None:
+            await message.answer("⏹ Profiler is not running.\n\nUsage: /profile start [seconds] | stop")
+            return
+        await message.answer(
+            f"▶️ Profiling for {time.monotonic() - window.started_monotonic:.0f}s: "
+            f"{window.sample_count} samples, max loop lag {window.lag.max * 1000:.0f}ms, "
+            f"{len(window.slow_callbacks)} stalls"
+        )
+
+    else:
+        await message.answer("❌ Usage: /profile start [seconds] | stop | status")
@@ -1,9 +1,11 @@
 from aiogram import Router, types, F
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
+from services.policy import command_policy
 from services.ssh_client import ssh_client
-from keyboards.main_menu import get_main_menu, get_quick_commands_menu, get_cancel_button
-from utils.helpers import format_command_output, truncate_text
+from services.quick_commands import quick_commands, run_quick_command
+from keyboards.main_menu import get_main_menu, get_quick_commands_menu, get_cancel_button, get_cancel_command_button
+from utils.helpers import format_command_output, truncate_text, answer_large_output
 import logging
 
 logger = logging.getLogger(__name__)
@@ -16,15 +18,48 @@ class CommandState(StatesGroup):
 # Quick commands handler
 @router.callback_query(F.data.startswith("quick_cmd:"))
 async def handle_quick_command(callback: types.CallbackQuery):
-    """Handle quick command from inline keyboard"""
-    command = callback.data.split(":", 1)[1]
+    """Handle quick command or macro from inline keyboard"""
+    command_id = callback.data.split(":", 1)[1]
+    quick_command = quick_commands.get(command_id)
     
+    if not quick_command:
+        await callback.answer("⚠️ This quick command is no longer available", show_alert=True)
+        return
+    
+    await callback.answer()
     await callback.message.edit_reply_markup(reply_markup=None)
-    processing_msg = await callback.message.answer(f"🔄 Executing: `{command}`", parse_mode="Markdown")
     
-    # Используем старый метод для быстрых команд
-    success, output = await ssh_client.execute_command(command)
-    formatted_output = format_command_output(command, output, success)
+    user_id = callback.from_user.id
+    command_id = ssh_client.new_command_id()
+    processing_msg = await callback.message.answer(
+        f"🔄 Executing: {quick_command.title}",
+        reply_markup=get_cancel_command_button(command_id)
+    )
+    
+    if quick_command.large_output:
+        command = quick_command.steps[0].command
+        success, output, archive_path = await ssh_client.execute_large_output(
+            user_id, command, timeout=quick_command.timeout, use_session=False, command_id=command_id
+        )
+        await processing_msg.delete()
+        await answer_large_output(callback.message, command, output, success, archive_path)
+        return
+    
+    # Используем старый метод для быстрых команд, все шаги отменяются одной кнопкой
+    results = await run_quick_command(
+        quick_command,
+        lambda command, timeout: ssh_client.execute_command(
+            command,
+            timeout=timeout,
+            user_id=user_id,
+            command_id=command_id,
+            output_limit=quick_command.output_limit
+        )
+    )
+    formatted_output = "\n\n".join(
+        format_command_output(step.command, output, success)
+        for step, success, output in results
+    )
     
     await processing_msg.delete()
     await callback.message.answer(
@@ -32,6 +67,16 @@ async def handle_quick_command(callback: types.CallbackQuery):
         parse_mode="MarkdownV2"
     )
 
+@router.callback_query(F.data.startswith("cancel_cmd:"))
+async def handle_cancel_command(callback: types.CallbackQuery):
+    """Cancel a running command and kill its remote process"""
+    command_id = callback.data.split(":", 1)[1]
+    success, text = ssh_client.cancel_command(command_id, callback.from_user.id)
+    
+    await callback.answer(text, show_alert=not success)
+    if success:
+        await callback.message.edit_reply_markup(reply_markup=None)
+
 # Menu command handlers
 @router.message(F.text == "📊 System Info")
 async def system_info(message: types.Message):
@@ -48,7 +93,7 @@ async def system_info(message: types.Message):
     full_output = ""
     for cmd, description in commands:
         # Используем старый метод для системных команд
-        success, output = await ssh_client.execute_command(cmd)
+        success, output = await ssh_client.execute_command(cmd, user_id=message.from_user.id)
         full_output += f"*{description}:*\n```{output}```\n\n"
     
     await processing_msg.delete()
@@ -63,7 +108,7 @@ async def disk_usage(message: types.Message):
     processing_msg = await message.answer("🔄 Checking disk usage...")
     
     # Используем старый метод
-    success, output = await ssh_client.execute_command("df -h")
+    success, output = await ssh_client.execute_command("df -h", user_id=message.from_user.id)
     
     if success:
         response = f"💾 *Disk Usage:*\n```{output}```"
@@ -86,7 +131,7 @@ async def service_status(message: types.Message):
     full_output = ""
     for cmd, description in commands:
         # Используем старый метод
-        success, output = await ssh_client.execute_command(cmd)
+        success, output = await ssh_client.execute_command(cmd, user_id=message.from_user.id)
         full_output += f"*{description}:*\n```{output}```\n\n"
     
     await processing_msg.delete()
@@ -101,7 +146,7 @@ async def process_list(message: types.Message):
     processing_msg = await message.answer("🔄 Getting process list...")
     
     # Используем старый метод
-    success, output = await ssh_client.execute_command("ps aux --sort=-%cpu | head -15")
+    success, output = await ssh_client.execute_command("ps aux --sort=-%cpu | head -15", user_id=message.from_user.id)
     
     if success:
         response = f"📈 *Top Processes by CPU:*\n```{output}```"
@@ -112,7 +157,7 @@ async def process_list(message: types.Message):
     await message.answer(response, parse_mode="MarkdownV2")
 
 @router.message(F.text == "⚡ Quick Commands")
-async def quick_commands(message: types.Message):
+async def show_quick_commands_menu(message: types.Message):
     """Show quick commands menu"""
     await message.answer(
         "⚡ *Quick Commands*\n\nSelect a command to execute:",
@@ -148,16 +193,21 @@ async def execute_custom_command(message: types.Message, state: FSMContext):
         await message.answer("❌ Please enter a valid command.")
         return
     
-    # Security check - prevent dangerous commands
-    dangerous_commands = ['rm -rf /', 'mkfs', 'dd if=', ':(){ :|:& };:', '> /dev/sda']
-    if any(dangerous in command for dangerous in dangerous_commands):
-        await message.answer("🚫 This command is blocked for security reasons.")
+    # Security check - the client enforces the policy too, this avoids a needless progress message
+    allowed, reason = command_policy.check(command, message.from_user.id)
+    if not allowed:
+        await message.answer(reason)
         return
     
-    processing_msg = await message.answer(f"🔄 Executing: `{command}`", parse_mode="Markdown")
+    command_id = ssh_client.new_command_id()
+    processing_msg = await message.answer(
+        f"🔄 Executing: `{command}`",
+        parse_mode="Markdown",
+        reply_markup=get_cancel_command_button(command_id)
+    )
     
     # Используем старый метод для единичных команд
-    success, output = await ssh_client.execute_command(command)
+    success, output = await ssh_client.execute_command(command, user_id=message.from_user.id, command_id=command_id)
     formatted_output = format_command_output(command, output, success)
     
     await processing_msg.delete()
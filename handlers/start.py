@@ -2,6 +2,7 @@ from aiogram import Router, types
 from aiogram.filters import Command
 from keyboards.main_menu import get_main_menu
 from config.config import config
+from middlewares.access import access_middleware
 
 router = Router()
 
@@ -53,6 +54,11 @@ async def cmd_help(message: types.Message):
         /start - Start the bot
         /help - Show this help
         /status - Check bot and server status
+        /audit - Query the command audit log (admins)
+        /profile - Profile the bot: start [seconds], stop (admins)
+        /history - Commands of the terminal session, !n runs one again
+        /grep - Search outputs of past terminal commands
+        /complete - Complete a command or path (also inline: @bot cmd)
 
         *Security Notes:*
         • Commands are executed with your SSH credentials
@@ -70,13 +76,19 @@ async def cmd_status(message: types.Message):
     status_text = "🔍 *System Status*\n\n"
     
     # Check SSH connection
-    if ssh_client.connection:
+    if ssh_client.single_connection:
         status_text += "🔗 *SSH Connection:* ✅ Connected\n"
     else:
         status_text += "🔗 *SSH Connection:* ❌ Disconnected\n"
     
     status_text += f"👤 *Admin Access:* {'✅ Yes' if message.from_user.id in config.ADMIN_IDS else '❌ No'}\n"
     status_text += f"🖥️ *Target Server:* {config.SSH_HOST}\n"
-    status_text += f"👤 *SSH User:* {config.SSH_USERNAME}"
+    status_text += f"👤 *SSH User:* {config.SSH_USERNAME}\n"
+    
+    dropped = access_middleware.dropped
+    status_text += (
+        f"🛡️ *Dropped updates:* {dropped['unauthorized']} unauthorized, "
+        f"{dropped['rate_limited']} rate limited, {dropped['duplicate']} duplicates"
+    )
     
     await message.answer(status_text, parse_mode="Markdown")
\ No newline at end of file
@@ -1,17 +1,22 @@
+import re
 from aiogram import Router, types, F
+from aiogram.filters import Command, CommandObject
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
-from services.ssh_client import StatefulSSHClient as SSHClient
-from keyboards.main_menu import get_main_menu, get_terminal_keyboard
-from utils.helpers import truncate_text
+from services.completion import completion_index
+from services.history import command_history
+from services.policy import command_policy
+from services.ssh_client import ssh_client
+from keyboards.main_menu import get_main_menu, get_terminal_keyboard, get_completion_keyboard
+from utils.helpers import truncate_text, answer_large_output, run_with_cancel_button
 import logging
 
 logger = logging.getLogger(__name__)
 
 router = Router()
 
-# Use stateful client
-ssh_client = SSHClient()
+# !! (last command), !12 (command number 12), !-2 (second to last)
+HISTORY_REFERENCE = re.compile(r'!(!|-?\d+)')
 
 class TerminalState(StatesGroup):
     active = State()
@@ -21,32 +26,39 @@ async def start_terminal_mode(message: types.Message, state: FSMContext):
     """Start terminal mode"""
     user_id = message.from_user.id
     
-    processing_msg = await message.answer("🔄 Starting terminal session with state preservation...")
+    processing_msg = await message.answer("🔄 Starting persistent shell session...")
     
     success = await ssh_client.create_session(user_id)
     
     if success:
+        # Every terminal session starts with an empty history
+        command_history.drop(user_id)
+        
         # Get current directory
         dir_success, current_dir = await ssh_client.get_current_directory(user_id)
+        completion_index.visit(current_dir)
         
         await processing_msg.delete()
         
         welcome_text = f"""
 💻 *Terminal Mode Activated - State Preserved!*
 
-✅ Directory state is now preserved between commands!
-✅ `cd` commands work correctly
-✅ Each command executes in the proper context
+✅ All commands run in one persistent shell
+✅ `cd`, `export`, aliases and functions are kept between commands
+✅ Virtualenvs stay active after `source venv/bin/activate`
 
 *Current directory:* `{current_dir if dir_success else '~'}`
 
 *Try this sequence to test:*
-1. `pwd` - See current directory
-2. `cd /var/log` - Change directory  
-3. `pwd` - Confirm it changed to /var/log
+1. `cd /var/log` - Change directory
+2. `export GREETING=hello` - Set a variable
+3. `pwd; echo $GREETING` - Both are still there
 4. `ls` - See log files
 
-The directory state is maintained throughout your session!
+*History:* /history lists past commands, `!!` or `!12` runs one again, /grep searches their outputs
+*Completion:* `/complete sys` or type `@bot_username sys` in the chat
+
+The shell state is maintained throughout your session!
         """
         
         await message.answer(
@@ -68,6 +80,7 @@ async def exit_terminal_mode(message: types.Message, state: FSMContext):
     """Exit terminal mode"""
     user_id = message.from_user.id
     await ssh_client.close_session(user_id)
+    command_history.drop(user_id)
     await state.clear()
     
     await message.answer(
@@ -113,6 +126,122 @@ async def go_home_directory(message: types.Message):
     else:
         await message.answer(f"❌ Failed to change directory:\n```{output}```", parse_mode="Markdown")
 
+@router.message(Command("gz"))
+async def large_output_command(message: types.Message, command: CommandObject):
+    """Execute command in large output mode, big results come back as .txt.gz"""
+    user_id = message.from_user.id
+    remote_command = (command.args or "").strip()
+    
+    if not remote_command:
+        await message.answer("Usage: /gz <command>\n\nOutput above the size limit is sent as a compressed file.")
+        return
+    
+    # Security check
+    allowed, reason = command_policy.check(remote_command, user_id)
+    if not allowed:
+        await message.answer(reason)
+        return
+    
+    await message.bot.send_chat_action(message.chat.id, "upload_document")
+    
+    command_id = ssh_client.new_command_id()
+    success, output, archive_path = await run_with_cancel_button(
+        message,
+        command_id,
+        ssh_client.execute_large_output(user_id, remote_command, command_id=command_id)
+    )
+    await answer_large_output(message, remote_command, output, success, archive_path)
+
+@router.message(Command("history"))
+async def show_history(message: types.Message, command: CommandObject):
+    """Show the last commands of the terminal session"""
+    args = (command.args or "").strip()
+    count = int(args) if args.isdigit() else 20
+    
+    history = command_history.get(message.from_user.id)
+    entries = history.last(count)
+    if not entries:
+        await message.answer("📜 History is empty. Commands run in Terminal Mode are kept here.")
+        return
+    
+    lines = [f"📜 History (last {len(entries)} of {history.next_number - 1}), run again with !n:"]
+    for entry in entries:
+        status_icon = "✅" if entry.success else "❌"
+        command_text = entry.command if len(entry.command) <= 80 else entry.command[:77] + "..."
+        lines.append(f"{entry.number:>4} {status_icon} {command_text}  [{entry.cwd}]")
+    
+    await message.answer(truncate_text("\n".join(lines)))
+
+@router.message(Command("grep"))
+async def grep_history(message: types.Message, command: CommandObject):
+    """Search the outputs of past terminal commands, without touching the server"""
+    args = (command.args or "").strip()
+    flags = 0
+    if args.startswith("-i "):
+        flags = re.IGNORECASE
+        args = args[3:].strip()
+    
+    if not args:
+        await message.answer("Usage: /grep [-i] <pattern>\n\nSearches the outputs of commands run in this terminal session.")
+        return
+    
+    try:
+        pattern = re.compile(args, flags)
+    except re.error:
+        pattern = re.compile(re.escape(args), flags)
+    
+    results = command_history.get(message.from_user.id).search(pattern, max_lines=50)
+    if not results:
+        await message.answer(f"🔎 No matches for '{args}' in the session history.")
+        return
+    
+    lines = [f"🔎 Matches for '{args}':"]
+    for entry, matched_lines in results:
+        lines.append(f"\n#{entry.number} $ {entry.command}")
+        lines.extend(f"  {line[:200]}" for line in matched_lines)
+    
+    await message.answer(truncate_text("\n".join(lines)))
+
+@router.message(Command("complete"))
+async def complete_command(message: types.Message, command: CommandObject):
+    """Offer completions of a partial command as keyboard buttons"""
+    partial = command.args or ""
+    if not partial.strip():
+        await message.answer("Usage: /complete <partial command>\n\nExample: /complete tail -f /var/lo")
+        return
+    
+    _, cwd = await ssh_client.get_current_directory(message.from_user.id)
+    suggestions = completion_index.complete(partial, cwd)
+    
+    if not suggestions:
+        if completion_index.is_refreshing():
+            await message.answer("⏳ Completion index is being updated, try again in a moment.")
+        else:
+            await message.answer("🤷 No completions found.")
+        return
+    
+    await message.answer(
+        f"💡 {len(suggestions)} completions, tap one to run it:",
+        reply_markup=get_completion_keyboard(suggestions)
+    )
+
+@router.inline_query()
+async def inline_complete(inline_query: types.InlineQuery):
+    """Complete the command typed after the bot's username, choosing one sends it"""
+    _, cwd = await ssh_client.get_current_directory(inline_query.from_user.id)
+    suggestions = completion_index.complete(inline_query.query, cwd, limit=20) if inline_query.query.strip() else []
+    
+    results = [
+        types.InlineQueryResultArticle(
+            id=str(position),
+            title=suggestion,
+            input_message_content=types.InputTextMessageContent(message_text=suggestion)
+        )
+        for position, suggestion in enumerate(suggestions)
+    ]
+    # Personal and short-lived: suggestions depend on the user's directory and the index age
+    await inline_query.answer(results, cache_time=5, is_personal=True)
+
 @router.message(TerminalState.active)
 async def handle_terminal_command(message: types.Message, state: FSMContext):
     """Handle commands in terminal mode"""
@@ -132,18 +261,40 @@ async def handle_terminal_command(message: types.Message, state: FSMContext):
         await message.answer("🧹 Screen cleared. Continue with your commands:")
         return
     
+    history = command_history.get(user_id)
+    
+    # Re-run a command from the history, it goes through the same checks as a typed one
+    reference = HISTORY_REFERENCE.fullmatch(command)
+    if reference:
+        entry = history.resolve(reference.group(1))
+        if entry is None:
+            await message.answer(f"❌ No such command in history: {command}")
+            return
+        command = entry.command
+    
     # Security check
-    dangerous_commands = ['rm -rf /', 'mkfs', 'dd if=', ':(){ :|:& };:', '> /dev/sda']
-    if any(dangerous in command for dangerous in dangerous_commands):
-        await message.answer("🚫 This command is blocked for security reasons.")
+    allowed, reason = command_policy.check(command, user_id)
+    if not allowed:
+        await message.answer(reason)
         return
     
     # Show typing action
     await message.bot.send_chat_action(message.chat.id, "typing")
     
     try:
-        # Execute command with state preservation
-        success, output = await ssh_client.execute_in_session(user_id, command)
+        # Execute command with state preservation, long ones get a cancel button
+        _, cwd = await ssh_client.get_current_directory(user_id)
+        command_id = ssh_client.new_command_id()
+        success, output = await run_with_cancel_button(
+            message,
+            command_id,
+            ssh_client.execute_in_session(user_id, command, command_id=command_id)
+        )
+        history.add(command, cwd, success, output)
+        
+        # Keep the directory the user ends up in ready for completion
+        _, new_cwd = await ssh_client.get_current_directory(user_id)
+        completion_index.visit(new_cwd)
         
         # Format output
         if success:
@@ -1,5 +1,8 @@
+from functools import lru_cache
+from typing import List
 from aiogram.types import ReplyKeyboardMarkup, KeyboardButton, InlineKeyboardMarkup, InlineKeyboardButton
 from aiogram.utils.keyboard import ReplyKeyboardBuilder, InlineKeyboardBuilder
+from services.quick_commands import quick_commands
 
 def get_main_menu() -> ReplyKeyboardMarkup:
     """Get main menu keyboard"""
@@ -17,20 +20,18 @@ def get_main_menu() -> ReplyKeyboardMarkup:
     return builder.as_markup(resize_keyboard=True)
 
 def get_quick_commands_menu() -> InlineKeyboardMarkup:
-    """Get quick commands inline keyboard"""
+    """Get quick commands inline keyboard, rebuilt only when the registry changes"""
+    quick_commands.refresh()
+    return _build_quick_commands_menu(quick_commands.version)
+
+@lru_cache(maxsize=1)
+def _build_quick_commands_menu(version: int) -> InlineKeyboardMarkup:
+    """Build quick commands keyboard for a registry version"""
     builder = InlineKeyboardBuilder()
     
-    commands = [
-        ("🔄 Update System", "sudo apt update && sudo apt upgrade -y"),
-        ("🧹 Clean Cache", "sudo apt autoremove -y && sudo apt autoclean"),
-        ("📊 Memory Info", "free -h"),
-        ("🌐 Network Stats", "ss -tuln"),
-        ("📦 Installed Packages", "dpkg --get-selections | wc -l"),
-        ("👥 Logged Users", "who"),
-    ]
-    
-    for text, command in commands:
-        builder.add(InlineKeyboardButton(text=text, callback_data=f"quick_cmd:{command}"))
+    # Buttons carry only the short id, the command itself stays on our side
+    for quick_command in quick_commands.commands.values():
+        builder.add(InlineKeyboardButton(text=quick_command.title, callback_data=f"quick_cmd:{quick_command.id}"))
     
     builder.adjust(2)
     return builder.as_markup()
@@ -42,6 +43,18 @@ def get_cancel_button() -> ReplyKeyboardMarkup:
         resize_keyboard=True
     )
 
+def get_cancel_command_button(command_id: str) -> InlineKeyboardMarkup:
+    """Get inline button that cancels a running command"""
+    return InlineKeyboardMarkup(
+        inline_keyboard=[[InlineKeyboardButton(text="⛔ Cancel", callback_data=f"cancel_cmd:{command_id}")]]
+    )
+
+def get_completion_keyboard(suggestions: List[str]) -> ReplyKeyboardMarkup:
+    """Get terminal mode keyboard with completion suggestions on top"""
+    keyboard = [[KeyboardButton(text=suggestion)] for suggestion in suggestions]
+    keyboard.extend(get_terminal_keyboard().keyboard)
+    return ReplyKeyboardMarkup(keyboard=keyboard, resize_keyboard=True)
+
 def get_terminal_keyboard() -> ReplyKeyboardMarkup:
     """Get terminal mode keyboard"""
     builder = ReplyKeyboardBuilder()
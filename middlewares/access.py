@@ -0,0 +1,108 @@
+import time
+from collections import Counter
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional
+from aiogram import BaseMiddleware
+from aiogram.types import CallbackQuery, InlineQuery, Message, TelegramObject
+from config.config import config
+import logging
+
+logger = logging.getLogger(__name__)
+
+class AccessMiddleware(BaseMiddleware):
+    """Drop updates before any handler, SSH or Telegram work is done
+
+    Checks run cheapest first: admin membership in a frozenset, collapsing of
+    identical requests within a short window (double taps, client resends),
+    then a per-user token bucket. Dropped updates are only counted.
+    """
+
+    def __init__(self, admin_ids: frozenset, rate: float, burst: int, duplicate_window: float):
+        self.admin_ids = admin_ids
+        self.rate = rate
+        self.burst = burst
+        self.duplicate_window = duplicate_window
+        self.buckets: Dict[int, List[float]] = {}  # user_id -> [tokens, updated_at]
+        self.recent: Dict[Hashable, float] = {}  # request key -> last seen
+        self.dropped: Counter = Counter()
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        user = data.get('event_from_user')
+        if user is None or user.id not in self.admin_ids:
+            self.dropped['unauthorized'] += 1
+            return None
+
+        # Inline queries come per keystroke and are answered from the local
+        # completion index, there is no server work to protect. Cancelling
+        # only stops work, so it must get through right after a burst
+        if isinstance(event, InlineQuery) or (
+            isinstance(event, CallbackQuery) and event.data and event.data.startswith('cancel_cmd:')
+        ):
+            return await handler(event, data)
+
+        now = time.monotonic()
+        key = self._request_key(user.id, event)
+
+        if self._is_duplicate(key, now):
+            self.dropped['duplicate'] += 1
+            return None
+
+        if not self._take_token(user.id, now):
+            self.dropped['rate_limited'] += 1
+            return None
+
+        # Only accepted requests open a window, so resending a dropped one
+        # can't keep it suppressed
+        self._remember(key, now)
+        return await handler(event, data)
+
+    def _request_key(self, user_id: int, event: TelegramObject) -> Optional[Hashable]:
+        """Identify requests that would trigger the same work"""
+        if isinstance(event, Message) and event.text:
+            return user_id, event.chat.id, event.text
+        if isinstance(event, CallbackQuery):
+            message_id = event.message.message_id if event.message else None
+            return user_id, message_id, event.data
+        return None
+
+    def _is_duplicate(self, key: Optional[Hashable], now: float) -> bool:
+        if key is None:
+            return False
+
+        last_seen = self.recent.get(key)
+        return last_seen is not None and now - last_seen < self.duplicate_window
+
+    def _remember(self, key: Optional[Hashable], now: float):
+        if key is None:
+            return
+
+        self.recent[key] = now
+        if len(self.recent) > 1024:
+            self.recent = {
+                key: seen for key, seen in self.recent.items()
+                if now - seen < self.duplicate_window
+            }
+
+    def _take_token(self, user_id: int, now: float) -> bool:
+        bucket = self.buckets.get(user_id)
+        if bucket is None:
+            bucket = self.buckets[user_id] = [float(self.burst), now]
+
+        bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+        bucket[1] = now
+
+        if bucket[0] < 1:
+            return False
+        bucket[0] -= 1
+        return True
+
+access_middleware = AccessMiddleware(
+    admin_ids=config.ADMIN_IDS,
+    rate=config.RATE_LIMIT_PER_SECOND,
+    burst=config.RATE_LIMIT_BURST,
+    duplicate_window=config.DUPLICATE_WINDOW
+)
@@ -0,0 +1,56 @@
+import time
+from typing import Any, Awaitable, Callable, Dict
+from aiogram import BaseMiddleware, Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.methods import TelegramMethod
+from aiogram.methods.base import Response, TelegramType
+from aiogram.types import TelegramObject
+from services.profiler import profiler
+
+class HandlerTimingMiddleware(BaseMiddleware):
+    """Time every handler call while the profiler is running
+
+    Registered as an inner middleware, so it only sees updates that passed
+    the access checks and knows which handler was chosen.
+    """
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        if not profiler.active:
+            return await handler(event, data)
+
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        finally:
+            handler_object = data.get('handler')
+            if handler_object:
+                name = f"{handler_object.callback.__module__}.{handler_object.callback.__qualname__}"
+            else:
+                name = type(event).__name__
+            profiler.record('handlers', name, time.perf_counter() - started)
+
+class TelegramRequestTimer(BaseRequestMiddleware):
+    """Time every Telegram Bot API request while the profiler is running"""
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot: Bot,
+        method: TelegramMethod[TelegramType]
+    ) -> Response[TelegramType]:
+        if not profiler.active:
+            return await make_request(bot, method)
+
+        started = time.perf_counter()
+        try:
+            return await make_request(bot, method)
+        finally:
+            profiler.record('telegram', type(method).__name__, time.perf_counter() - started)
+
+handler_timing_middleware = HandlerTimingMiddleware()
+telegram_request_timer = TelegramRequestTimer()
@@ -0,0 +1,324 @@
+import heapq
+import json
+import logging
+import os
+import queue
+import re
+import threading
+import time
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Optional, List, Dict, Tuple
+from config.config import config
+
+logger = logging.getLogger(__name__)
+
+# Records are summarised in blocks of about this many bytes
+INDEX_BLOCK_BYTES = 64 * 1024
+# Our own records start with these keys, so most lines need no JSON parse.
+# No anchor: '{"ts": ' can't occur inside a JSON string, where quotes are
+# escaped, and a literal start lets findall skip ahead quickly
+RECORD_PREFIX = re.compile(rb'\{"ts": ([-+.0-9eE]+), "time": "[^"\n]*", "user_id": (null|-?\d+)[,}]')
+
+
+@dataclass
+class Summary:
+    """Time range and users of a run of records"""
+    min_ts: float = float('inf')
+    max_ts: float = float('-inf')
+    users: set = field(default_factory=set)
+
+    def merge(self, other: 'Summary'):
+        self.min_ts = min(self.min_ts, other.min_ts)
+        self.max_ts = max(self.max_ts, other.max_ts)
+        self.users |= other.users
+
+    def matches(self, user_id: Optional[int], since: Optional[float]) -> bool:
+        if not self.users or (since is not None and self.max_ts < since):
+            return False
+        return user_id is None or user_id in self.users
+
+
+@dataclass
+class Block(Summary):
+    """Consecutive records in a file, [offset, end) in bytes"""
+    offset: int = 0
+    end: int = 0
+
+
+@dataclass
+class FileIndex(Summary):
+    size: int = 0  # bytes already indexed
+    blocks: List[Block] = field(default_factory=list)
+
+
+class AuditLog:
+    """Structured JSONL audit trail of executed commands
+
+    record() only enqueues and never touches the disk, so it is safe to call
+    from the event loop. A background thread writes records in batches,
+    fsyncs at most once per interval and rotates files by size and age.
+
+    Queries go through a sparse in-memory index: per file and per block of
+    about INDEX_BLOCK_BYTES, the time range and the set of users. It is
+    caught up incrementally, only bytes appended since the previous query
+    are read. A query reads just the blocks that can hold matching records,
+    newest first, and stops once older blocks can't improve the result.
+    """
+
+    def __init__(self, directory: str, prefix: str = 'audit'):
+        self.directory = directory
+        self.prefix = prefix
+        self._queue: queue.Queue = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+
+        self._index_lock = threading.Lock()
+        self._files: Dict[str, FileIndex] = {}
+
+    def start(self):
+        """Start the background writer"""
+        if self._thread and self._thread.is_alive():
+            return
+
+        os.makedirs(self.directory, exist_ok=True)
+        self._thread = threading.Thread(target=self._writer, name='audit-writer', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        """Flush pending records and stop the writer"""
+        if self._thread:
+            self._queue.put(None)
+            self._thread.join(timeout)
+            self._thread = None
+
+    def record(self, user_id: Optional[int], host: str, command: str, cwd: Optional[str],
+               exit_status: Optional[int], duration: float, output_size: int):
+        """Queue one executed command for writing"""
+        now = time.time()
+        self._queue.put({
+            'ts': round(now, 3),
+            'time': datetime.fromtimestamp(now).isoformat(timespec='seconds'),
+            'user_id': user_id,
+            'host': host,
+            'command': command,
+            'cwd': cwd,
+            'exit_status': exit_status,
+            'duration': round(duration, 3),
+            'output_size': output_size,
+        })
+
+    def _writer(self):
+        """Background thread: batch, write, fsync and rotate"""
+        file = None
+        opened_at = 0.0
+        last_fsync = time.monotonic()
+        dirty = False
+
+        while True:
+            try:
+                batch = [self._queue.get(timeout=config.AUDIT_FSYNC_INTERVAL)]
+            except queue.Empty:
+                batch = []
+
+            while len(batch) < 1000:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            stopping = None in batch
+            records = [record for record in batch if record is not None]
+
+            try:
+                if records:
+                    if file and (file.tell() >= config.AUDIT_MAX_BYTES
+                                 or time.time() - opened_at >= config.AUDIT_ROTATE_SECONDS):
+                        self._fsync(file)
+                        file.close()
+                        file = None
+                        self._prune()
+
+                    if not file:
+                        file, opened_at = self._open_file()
+
+                    file.write(''.join(json.dumps(record, ensure_ascii=False) + '\n' for record in records))
+                    file.flush()
+                    dirty = True
+
+                if dirty and (stopping or time.monotonic() - last_fsync >= config.AUDIT_FSYNC_INTERVAL):
+                    self._fsync(file)
+                    last_fsync = time.monotonic()
+                    dirty = False
+            except Exception as e:
+                logger.error(f"Audit write failed: {e}")
+
+            if stopping:
+                if file:
+                    file.close()
+                return
+
+    def _open_file(self):
+        """Open a new audit file named after its creation time"""
+        opened_at = time.time()
+        stamp = time.strftime('%Y%m%dT%H%M%S', time.localtime(opened_at))
+        name = f"{self.prefix}-{stamp}{int(opened_at * 1000) % 1000:03d}.jsonl"
+        return open(os.path.join(self.directory, name), 'a', encoding='utf-8'), opened_at
+
+    def _fsync(self, file):
+        file.flush()
+        os.fsync(file.fileno())
+
+    def _prune(self):
+        """Delete the oldest files beyond the configured backup count"""
+        # Other prefixes (e.g. per-worker files) may share the directory
+        pattern = re.compile(rf'{re.escape(self.prefix)}-\d{{8}}T\d+\.jsonl')
+        files = sorted(name for name in os.listdir(self.directory) if pattern.fullmatch(name))
+        for name in files[:-max(config.AUDIT_BACKUP_COUNT, 1)]:
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except OSError as e:
+                logger.warning(f"Failed to remove old audit file {name}: {e}")
+
+    def _refresh_index(self):
+        """Index records appended since the last call"""
+        try:
+            names = [name for name in os.listdir(self.directory) if name.endswith('.jsonl')]
+        except FileNotFoundError:
+            return
+
+        paths = {os.path.join(self.directory, name) for name in names}
+        for path in set(self._files) - paths:
+            del self._files[path]
+
+        for path in sorted(paths):
+            index = self._files.get(path)
+            if index is None:
+                index = self._files[path] = FileIndex()
+            try:
+                if os.path.getsize(path) <= index.size:
+                    continue
+                with open(path, 'rb') as file:
+                    file.seek(index.size)
+                    self._index_lines(index, file)
+            except OSError as e:
+                logger.warning(f"Failed to index audit file {path}: {e}")
+
+    def _index_lines(self, index: FileIndex, file):
+        """Summarise complete lines after index.size, a block at a time"""
+        pending = b''
+        while True:
+            chunk = file.read(INDEX_BLOCK_BYTES)
+            data = pending + chunk
+            end = data.rfind(b'\n') + 1
+            if not end:
+                if not chunk:
+                    return  # only a line that is still being written
+                pending = data  # a line longer than a block
+                continue
+
+            summary = summarize(data[:end])
+            pending = data[end:]
+
+            # Small appends since the previous query grow the last block
+            last = index.blocks[-1] if index.blocks else None
+            if last is not None and last.end - last.offset + end <= INDEX_BLOCK_BYTES:
+                last.merge(summary)
+                last.end += end
+            else:
+                index.blocks.append(Block(summary.min_ts, summary.max_ts, summary.users,
+                                          offset=index.size, end=index.size + end))
+            index.merge(summary)
+            index.size += end
+
+    def query(self, user_id: Optional[int] = None, since: Optional[float] = None,
+              limit: int = 20) -> List[dict]:
+        """Return the newest matching records, newest first
+
+        Blocking: call through asyncio.to_thread from handlers.
+        """
+        with self._index_lock:
+            self._refresh_index()
+            candidates = [
+                (block.max_ts, path, block.offset, block.end)
+                for path, index in self._files.items() if index.matches(user_id, since)
+                for block in index.blocks if block.matches(user_id, since)
+            ]
+
+        # Files of different workers overlap in time, so blocks are visited by
+        # their newest record and the search stops once a block is older than
+        # everything collected
+        candidates.sort(reverse=True)
+        newest: List[Tuple[float, int, dict]] = []  # min-heap of the best `limit` records
+        sequence = 0
+
+        for max_ts, path, offset, end in candidates:
+            if len(newest) >= limit and max_ts < newest[0][0]:
+                break
+            for ts, record in self._read_block(path, offset, end, user_id, since):
+                sequence += 1
+                item = (ts, sequence, record)
+                if len(newest) < limit:
+                    heapq.heappush(newest, item)
+                elif item > newest[0]:
+                    heapq.heapreplace(newest, item)
+
+        return [record for _, _, record in sorted(newest, reverse=True)]
+
+    def _read_block(self, path: str, offset: int, end: int, user_id: Optional[int],
+                    since: Optional[float]) -> List[Tuple[float, dict]]:
+        """Matching records of one block"""
+        try:
+            with open(path, 'rb') as file:
+                file.seek(offset)
+                data = file.read(end - offset)
+        except OSError:
+            return []  # pruned after the index was read
+
+        records = []
+        for line in data.splitlines():
+            key = parse_key(line)
+            if key is None:
+                continue
+            ts, record_user_id = key
+            if (since is not None and ts < since) or (user_id is not None and record_user_id != user_id):
+                continue
+            try:
+                records.append((ts, json.loads(line)))
+            except ValueError:
+                continue
+        return records
+
+
+def summarize(data: bytes) -> Summary:
+    """Time range and users of the records in complete lines"""
+    keys = RECORD_PREFIX.findall(data)
+    if len(keys) == data.count(b'\n'):
+        timestamps = [float(ts) for ts, _ in keys]
+        users = {None if user_id == b'null' else int(user_id) for user_id in {user_id for _, user_id in keys}}
+    else:
+        # Some lines weren't written by us, look at each one
+        parsed = [key for key in map(parse_key, data.splitlines()) if key]
+        timestamps = [ts for ts, _ in parsed]
+        users = {user_id for _, user_id in parsed}
+
+    if not timestamps:
+        return Summary()
+    return Summary(min(timestamps), max(timestamps), users)
+
+
+def parse_key(line: bytes) -> Optional[Tuple[float, Optional[int]]]:
+    """(timestamp, user id) of one JSONL line, None if it isn't a record"""
+    match = RECORD_PREFIX.match(line)
+    if match:
+        user_id = match.group(2)
+        return float(match.group(1)), None if user_id == b'null' else int(user_id)
+
+    try:
+        record = json.loads(line)
+        return float(record['ts']), record.get('user_id')
+    except (ValueError, KeyError, TypeError, AttributeError):
+        return None
+
+
+# Worker processes write their own files, queries still see all of them
+audit_log = AuditLog(config.AUDIT_DIR, prefix=f"audit-{config.WORKER_ID}" if config.WORKER_ID else 'audit')
@@ -0,0 +1,269 @@
+import asyncio
+import hashlib
+import json
+import multiprocessing
+import os
+import shutil
+import signal
+import struct
+import tempfile
+import time
+from typing import List, Optional, Tuple
+from aiohttp import web
+from aiogram import Bot
+from config.config import config
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Frames on the worker sockets: 4-byte big-endian length, then the raw update JSON
+FRAME_HEADER = struct.Struct('>I')
+
+def shard_for(user_id: Optional[int], workers: int) -> int:
+    """Stable worker index for a user, the same in every process and run"""
+    if user_id is None or workers <= 1:
+        return 0
+    digest = hashlib.blake2b(str(user_id).encode(), digest_size=8).digest()
+    return int.from_bytes(digest, 'big') % workers
+
+def extract_user_id(update: dict) -> Optional[int]:
+    """Find the user (or chat) an update belongs to"""
+    for key, value in update.items():
+        if key == 'update_id' or not isinstance(value, dict):
+            continue
+        if 'from' in value:
+            return value['from']['id']
+        if 'user' in value:
+            return value['user']['id']
+        if 'chat' in value:
+            return value['chat']['id']
+    return None
+
+# Directory holding the worker sockets, created on first use by the front
+_socket_dir: Optional[str] = None
+_socket_dir_created = False
+
+def socket_directory() -> str:
+    """Directory for the worker sockets that only this user can enter
+
+    Whoever connects to a worker socket can feed it updates from any user,
+    so the sockets never live in a shared directory like /tmp. Uses
+    IPC_SOCKET_DIR if set, otherwise a fresh private temporary directory.
+    """
+    global _socket_dir, _socket_dir_created
+    if _socket_dir is None:
+        if config.IPC_SOCKET_DIR:
+            os.makedirs(config.IPC_SOCKET_DIR, mode=0o700, exist_ok=True)
+            # Fails if the directory belongs to someone else
+            os.chmod(config.IPC_SOCKET_DIR, 0o700)
+            _socket_dir = config.IPC_SOCKET_DIR
+        else:
+            _socket_dir = tempfile.mkdtemp(prefix='tgbot-')
+            _socket_dir_created = True
+    return _socket_dir
+
+def remove_socket_directory():
+    """Remove the socket directory if it was created by socket_directory()"""
+    global _socket_dir, _socket_dir_created
+    if _socket_dir_created:
+        shutil.rmtree(_socket_dir, ignore_errors=True)
+    _socket_dir = None
+    _socket_dir_created = False
+
+def socket_path(index: int) -> str:
+    return os.path.join(socket_directory(), f"tgbot-worker-{index}.sock")
+
+async def write_frame(writer: asyncio.StreamWriter, payload: bytes):
+    writer.write(FRAME_HEADER.pack(len(payload)) + payload)
+    await writer.drain()
+
+async def read_frame(reader: asyncio.StreamReader) -> bytes:
+    """Read one frame, raises IncompleteReadError on EOF"""
+    header = await reader.readexactly(FRAME_HEADER.size)
+    return await reader.readexactly(FRAME_HEADER.unpack(header)[0])
+
+async def connect_worker(path: str, timeout: float = 30.0,
+                         process: Optional[multiprocessing.Process] = None) -> Tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+    """Connect to a worker socket, waiting for the worker to start listening
+
+    Fails at once if the worker process has already exited, e.g. on an
+    import error, instead of waiting for the timeout.
+    """
+    deadline = asyncio.get_running_loop().time() + timeout
+    while True:
+        try:
+            return await asyncio.open_unix_connection(path)
+        except (FileNotFoundError, ConnectionRefusedError):
+            if process is not None and not process.is_alive():
+                raise RuntimeError(f"{process.name} exited with code {process.exitcode}")
+            if asyncio.get_running_loop().time() > deadline:
+                raise
+            await asyncio.sleep(0.1)
+
+def start_worker_process(target, index: int) -> multiprocessing.Process:
+    """Spawn a worker process running target(index, socket_path)"""
+    path = socket_path(index)
+    if os.path.exists(path):
+        os.remove(path)
+
+    # spawn, not fork: the parent already has an event loop and open sockets
+    process = multiprocessing.get_context('spawn').Process(target=target, args=(index, path), name=f"bot-worker-{index}")
+    # Spawned children inherit the environment and read WORKER_ID when config is
+    # imported, before any log or audit file is opened
+    os.environ['WORKER_ID'] = f"w{index}"
+    try:
+        process.start()
+    finally:
+        del os.environ['WORKER_ID']
+    return process
+
+def start_worker_processes(target, count: int) -> List[multiprocessing.Process]:
+    return [start_worker_process(target, index) for index in range(count)]
+
+async def connect_worker_processes(processes: List[multiprocessing.Process]) -> List[Tuple[asyncio.StreamReader, asyncio.StreamWriter]]:
+    """Connect to every worker, terminating all of them if one fails to come up"""
+    try:
+        return [
+            await connect_worker(socket_path(index), process=process)
+            for index, process in enumerate(processes)
+        ]
+    except BaseException:
+        # Workers nobody connected to would wait for the front forever
+        await asyncio.to_thread(stop_worker_processes, processes, 0)
+        raise
+
+def stop_worker_processes(processes: List[multiprocessing.Process], timeout: float = 10.0):
+    """Give workers timeout seconds in total to exit, then terminate the rest"""
+    deadline = time.monotonic() + timeout
+    for process in processes:
+        process.join(max(0.0, deadline - time.monotonic()))
+    for process in processes:
+        if process.is_alive():
+            process.terminate()
+            process.join(5)
+
+async def run_front():
+    """Receive updates by webhook and route each user to a fixed worker
+
+    Each worker is a separate process with its own dispatcher, FSM storage
+    and SSH sessions. Hashing the user id keeps all of a user's updates, and
+    therefore their state, on one worker. A worker that died is restarted
+    when its next update arrives; if it can't be restarted the front stops.
+    """
+    bot = Bot(token=config.BOT_TOKEN)
+    processes = start_worker_processes(run_worker, config.WORKERS)
+    writers = [writer for _, writer in await connect_worker_processes(processes)]
+    locks = [asyncio.Lock() for _ in writers]
+    stop = asyncio.Event()
+
+    async def restart_worker(index: int):
+        logger.error(f"Worker {index} is down (exit code {processes[index].exitcode}), restarting")
+        writers[index].close()
+        await asyncio.to_thread(stop_worker_processes, [processes[index]], 0)
+        processes[index] = start_worker_process(run_worker, index)
+        _, writers[index] = await connect_worker(socket_path(index), process=processes[index])
+
+    async def deliver(index: int, payload: bytes):
+        async with locks[index]:
+            if not processes[index].is_alive() or writers[index].is_closing():
+                await restart_worker(index)
+            try:
+                await write_frame(writers[index], payload)
+            except (ConnectionError, OSError) as e:
+                logger.error(f"Failed to send update to worker {index}: {e}")
+                await restart_worker(index)
+                await write_frame(writers[index], payload)
+
+    async def handle_update(request: web.Request) -> web.Response:
+        if config.WEBHOOK_SECRET and request.headers.get('X-Telegram-Bot-Api-Secret-Token') != config.WEBHOOK_SECRET:
+            return web.Response(status=401)
+
+        payload = await request.read()
+        try:
+            index = shard_for(extract_user_id(json.loads(payload)), len(writers))
+        except (ValueError, KeyError, TypeError):
+            return web.Response(status=400)
+
+        try:
+            await deliver(index, payload)
+        except (ConnectionError, OSError, RuntimeError) as e:
+            # Crash loop or broken environment: fail fast instead of having
+            # Telegram retry into a dead worker
+            logger.critical(f"Worker {index} could not be restarted: {e}, stopping")
+            stop.set()
+            return web.Response(status=503)
+        return web.Response()
+
+    app = web.Application()
+    app.router.add_post(config.WEBHOOK_PATH, handle_update)
+    runner = web.AppRunner(app)
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    try:
+        await runner.setup()
+        site = web.TCPSite(runner, config.WEBHOOK_HOST, config.WEBHOOK_PORT)
+        await site.start()
+        await bot.set_webhook(
+            config.WEBHOOK_URL,
+            secret_token=config.WEBHOOK_SECRET or None
+        )
+        logger.info(f"Front started on {config.WEBHOOK_HOST}:{config.WEBHOOK_PORT}, routing to {config.WORKERS} workers")
+        await stop.wait()
+    finally:
+        try:
+            await bot.delete_webhook()
+            await bot.session.close()
+            await runner.cleanup()
+        finally:
+            # Closing the sockets tells workers to shut down
+            for writer in writers:
+                writer.close()
+            await asyncio.to_thread(stop_worker_processes, processes)
+            remove_socket_directory()
+
+def run_worker(index: int, path: str):
+    """Worker process entry point"""
+    # Ctrl+C reaches the whole process group, let the front drive shutdown
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    asyncio.run(_worker_main(path))
+
+async def _worker_main(path: str):
+    from bot import create_bot, create_dispatcher, setup_logging, start_services, stop_services
+
+    log_listener = setup_logging()
+    bot = create_bot()
+    dp = create_dispatcher()
+    await start_services()
+
+    tasks = set()
+    done = asyncio.Event()
+
+    async def handle_front(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                update = json.loads(await read_frame(reader))
+                task = asyncio.create_task(dp.feed_raw_update(bot, update))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+        except asyncio.IncompleteReadError:
+            pass
+        finally:
+            writer.close()
+            done.set()
+
+    server = await asyncio.start_unix_server(handle_front, path=path)
+    os.chmod(path, 0o600)
+    logger.info(f"Worker {config.WORKER_ID} listening on {path}")
+
+    try:
+        await done.wait()
+        if tasks:
+            await asyncio.wait(tasks, timeout=30)
+    finally:
+        server.close()
+        await stop_services(bot)
+        log_listener.stop()
+        if os.path.exists(path):
+            os.remove(path)
@@ -0,0 +1,192 @@
+import asyncio
+import posixpath
+import re
+import shlex
+import time
+from bisect import bisect_left
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+from config.config import config
+from services.ssh_client import ssh_client
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Builtins and keywords never show up in a PATH listing
+SHELL_BUILTINS = (
+    'alias', 'bg', 'cd', 'command', 'echo', 'eval', 'exec', 'exit', 'export', 'fg',
+    'history', 'jobs', 'kill', 'printf', 'pwd', 'read', 'set', 'source', 'test',
+    'type', 'ulimit', 'umask', 'unalias', 'unset', 'wait'
+)
+# After these the next word is a command name again
+COMMAND_PREFIXES = frozenset({'sudo', 'doas', 'nohup', 'time', 'exec', 'command', 'env', 'nice', 'watch', 'xargs'})
+SEPARATOR_ENDINGS = ('|', ';', '&', '(', '`')
+UNSAFE_CHARS = re.compile(r'([^\w@%+=:,./~-])')
+
+@dataclass
+class HostIndex:
+    """Completion data for one host"""
+    executables: List[str] = field(default_factory=list)  # sorted
+    executables_updated: float = 0.0  # monotonic time, 0 means never
+    home: Optional[str] = None
+    directories: 'OrderedDict[str, Tuple[float, List[str]]]' = field(default_factory=OrderedDict)  # LRU
+
+class CompletionIndex:
+    """Command and path completion answered from a local per-host index
+
+    Executables on PATH and the entries of directories the user visits are
+    fetched in the background and kept for COMPLETION_TTL seconds. Lookups
+    are a bisect into sorted lists and never wait for the server: missing or
+    stale data is scheduled for refresh and the current answer is returned.
+    """
+
+    def __init__(self, ttl: float, max_directories: int, max_entries: int):
+        self.ttl = ttl
+        self.max_directories = max_directories
+        self.max_entries = max_entries
+        self.hosts: Dict[str, HostIndex] = {}
+        self._refreshing: Dict[Tuple[str, str], asyncio.Task] = {}
+
+    def complete(self, line: str, cwd: Optional[str] = None, limit: int = 8,
+                 host: Optional[str] = None) -> List[str]:
+        """Completed versions of the command line, best first"""
+        host = host or config.SSH_HOST
+        index = self._host(host)
+        self._schedule_executables(host, index)
+
+        head, word = split_last_word(line)
+
+        if '/' not in word and is_command_position(head):
+            return [head + name for name in prefix_lookup(index.executables, word, limit)]
+
+        directory_part, _, base = word.rpartition('/')
+        if '/' in word:
+            directory_part += '/'
+
+        path = self._resolve(index, directory_part, cwd)
+        if path is None:
+            return []
+
+        entries = self._directory_entries(host, index, path)
+        return [
+            head + directory_part + UNSAFE_CHARS.sub(r'\\\1', name)
+            for name in prefix_lookup(entries, base, limit)
+        ]
+
+    def visit(self, directory: Optional[str], host: Optional[str] = None):
+        """Prefetch a directory the user is in, so completing in it is instant"""
+        if not directory or not directory.startswith('/'):
+            return
+        host = host or config.SSH_HOST
+        index = self._host(host)
+        self._schedule_executables(host, index)
+        self._directory_entries(host, index, directory)
+
+    def is_refreshing(self) -> bool:
+        return bool(self._refreshing)
+
+    def _host(self, host: str) -> HostIndex:
+        index = self.hosts.get(host)
+        if index is None:
+            index = self.hosts[host] = HostIndex()
+        return index
+
+    def _resolve(self, index: HostIndex, directory_part: str, cwd: Optional[str]) -> Optional[str]:
+        """Absolute directory for the typed directory part"""
+        if directory_part.startswith('~'):
+            if index.home is None:
+                return None
+            directory_part = index.home + directory_part[1:]
+
+        if not directory_part.startswith('/'):
+            base = cwd if cwd and cwd.startswith('/') else index.home
+            if base is None:
+                return None
+            directory_part = posixpath.join(base, directory_part)
+
+        return posixpath.normpath(directory_part)
+
+    def _directory_entries(self, host: str, index: HostIndex, path: str) -> List[str]:
+        cached = index.directories.get(path)
+        if cached is not None:
+            index.directories.move_to_end(path)
+        if cached is None or time.monotonic() - cached[0] > self.ttl:
+            self._schedule(host, path, self._refresh_directory(index, path))
+        return cached[1] if cached else []
+
+    def _schedule_executables(self, host: str, index: HostIndex):
+        if not index.executables_updated or time.monotonic() - index.executables_updated > self.ttl:
+            self._schedule(host, '', self._refresh_executables(index))
+
+    def _schedule(self, host: str, key: str, coroutine):
+        """Start a background refresh unless the same one is already running"""
+        if (host, key) in self._refreshing:
+            coroutine.close()
+            return
+
+        task = asyncio.ensure_future(coroutine)
+        self._refreshing[(host, key)] = task
+        task.add_done_callback(lambda _: self._refreshing.pop((host, key), None))
+
+    async def _refresh_executables(self, index: HostIndex):
+        # First line is $HOME, then the contents of every PATH directory
+        output = await ssh_client.run_internal(
+            f"printf '%s\\n' \"$HOME\"; "
+            f"IFS=:; for d in $PATH; do [ -d \"$d\" ] && ls -1 \"$d\"; done 2>/dev/null "
+            f"| head -n {self.max_entries * 4}"
+        )
+        index.executables_updated = time.monotonic()
+        if output is None:
+            return
+
+        lines = output.splitlines()
+        if lines:
+            index.home = lines[0] or None
+        index.executables = sorted(set(lines[1:]).union(SHELL_BUILTINS) - {''})
+        logger.info(f"Completion index: {len(index.executables)} executables")
+
+    async def _refresh_directory(self, index: HostIndex, path: str):
+        # -p marks directories with a trailing slash, so completing one continues into it
+        output = await ssh_client.run_internal(
+            f"ls -1Ap -- {shlex.quote(path)} 2>/dev/null | head -n {self.max_entries}"
+        )
+        if output is None:
+            return
+
+        index.directories[path] = (time.monotonic(), sorted(filter(None, output.splitlines())))
+        index.directories.move_to_end(path)
+        while len(index.directories) > self.max_directories:
+            index.directories.popitem(last=False)
+
+def split_last_word(line: str) -> Tuple[str, str]:
+    """('ls -la ', '/va') for 'ls -la /va'"""
+    match = re.search(r'[^\s;|&()<>`]*$', line)
+    return line[:match.start()], match.group()
+
+def is_command_position(head: str) -> bool:
+    """Whether the next word is a command name rather than an argument"""
+    stripped = head.rstrip()
+    if not stripped or stripped.endswith(SEPARATOR_ENDINGS):
+        return True
+    return stripped.split()[-1] in COMMAND_PREFIXES
+
+def prefix_lookup(items: List[str], prefix: str, limit: int) -> List[str]:
+    """Items starting with prefix, hidden ones only when the prefix asks for them"""
+    results = []
+    for position in range(bisect_left(items, prefix), len(items)):
+        item = items[position]
+        if not item.startswith(prefix):
+            break
+        if item.startswith('.') and not prefix.startswith('.'):
+            continue
+        results.append(item)
+        if len(results) >= limit:
+            break
+    return results
+
+completion_index = CompletionIndex(
+    ttl=config.COMPLETION_TTL,
+    max_directories=config.COMPLETION_MAX_DIRECTORIES,
+    max_entries=config.COMPLETION_MAX_ENTRIES
+)
@@ -0,0 +1,125 @@
+import re
+import time
+import zlib
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Deque, Dict, List, Optional, Tuple
+from config.config import config
+
+# Rough per-entry cost of the object itself, on top of the strings it holds
+ENTRY_OVERHEAD = 200
+
+@dataclass
+class HistoryEntry:
+    number: int
+    command: str
+    cwd: str
+    success: bool
+    timestamp: float
+    output: bytes = field(repr=False)  # zlib-compressed
+    output_size: int  # uncompressed, in bytes
+
+    @property
+    def memory_size(self) -> int:
+        return len(self.output) + len(self.command) + len(self.cwd) + ENTRY_OVERHEAD
+
+    def text(self) -> str:
+        return zlib.decompress(self.output).decode('utf-8', errors='replace')
+
+class CommandHistory:
+    """Ring buffer of one terminal session's commands and compressed outputs
+
+    Entries are numbered from 1 for the whole session. The oldest ones are
+    dropped once there are more than max_entries or they take more than
+    max_bytes, the newest entry is always kept.
+    """
+
+    def __init__(self, max_entries: int, max_bytes: int):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.entries: Deque[HistoryEntry] = deque()
+        self.memory_size = 0
+        self.next_number = 1
+
+    def add(self, command: str, cwd: str, success: bool, output: str) -> HistoryEntry:
+        data = output.encode('utf-8', errors='replace')
+        entry = HistoryEntry(
+            number=self.next_number,
+            command=command,
+            cwd=cwd,
+            success=success,
+            timestamp=time.time(),
+            output=zlib.compress(data, 6),
+            output_size=len(data)
+        )
+        self.next_number += 1
+        self.entries.append(entry)
+        self.memory_size += entry.memory_size
+
+        while len(self.entries) > 1 and (
+            len(self.entries) > self.max_entries or self.memory_size > self.max_bytes
+        ):
+            self.memory_size -= self.entries.popleft().memory_size
+
+        return entry
+
+    def get(self, number: int) -> Optional[HistoryEntry]:
+        """Entry by its number, numbers are contiguous so this is an index lookup"""
+        if not self.entries:
+            return None
+        index = number - self.entries[0].number
+        if 0 <= index < len(self.entries):
+            return self.entries[index]
+        return None
+
+    def resolve(self, reference: str) -> Optional[HistoryEntry]:
+        """Entry for a '!' reference: '!' (last), '-2' (second to last) or '12'"""
+        if reference == '!':
+            return self.entries[-1] if self.entries else None
+        number = int(reference)
+        if number < 0:
+            return self.entries[number] if -number <= len(self.entries) else None
+        return self.get(number)
+
+    def last(self, count: int) -> List[HistoryEntry]:
+        return list(self.entries)[-count:] if count > 0 else []
+
+    def search(self, pattern: re.Pattern, max_lines: int) -> List[Tuple[HistoryEntry, List[str]]]:
+        """Matching output lines per entry, newest entries first"""
+        results = []
+        remaining = max_lines
+
+        for entry in reversed(self.entries):
+            # Most outputs don't match, check the whole text before splitting it
+            text = entry.text()
+            if not pattern.search(text):
+                continue
+
+            lines = [line for line in text.splitlines() if pattern.search(line)][:remaining]
+            if not lines:
+                continue
+            results.append((entry, lines))
+            remaining -= len(lines)
+            if remaining <= 0:
+                break
+
+        return results
+
+class HistoryStore:
+    """Command histories of the users' terminal sessions"""
+
+    def __init__(self, max_entries: int, max_bytes: int):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.sessions: Dict[int, CommandHistory] = {}
+
+    def get(self, user_id: int) -> CommandHistory:
+        history = self.sessions.get(user_id)
+        if history is None:
+            history = self.sessions[user_id] = CommandHistory(self.max_entries, self.max_bytes)
+        return history
+
+    def drop(self, user_id: int):
+        self.sessions.pop(user_id, None)
+
+command_history = HistoryStore(config.HISTORY_MAX_ENTRIES, config.HISTORY_MAX_BYTES)
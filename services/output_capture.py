@@ -0,0 +1,72 @@
+class OutputCapture:
+    """Bounded capture of a command's output stream
+
+    Keeps the first head_bytes in a head buffer and the last tail_bytes in a
+    fixed-size ring buffer; everything in between is only counted. Memory
+    per command stays the same whatever the output size.
+    """
+
+    def __init__(self, head_bytes: int, tail_bytes: int, limit: int = 0):
+        self.head_bytes = head_bytes
+        self.tail_bytes = tail_bytes
+        self.limit = limit  # 0 means no limit, the output is drained
+        self.head = bytearray()
+        self.tail = bytearray(tail_bytes)
+        self.tail_pos = 0
+        self.tail_len = 0
+        self.total = 0
+        self.limit_reached = False
+
+    def feed(self, data: bytes) -> bool:
+        """Add a chunk of output, return True when it crosses the limit"""
+        self.total += len(data)
+
+        room = self.head_bytes - len(self.head)
+        if room > 0:
+            self.head += data[:room]
+            data = data[room:]
+
+        if data and self.tail_bytes:
+            self._write_tail(data)
+
+        if self.limit and not self.limit_reached and self.total > self.limit:
+            self.limit_reached = True
+            return True
+        return False
+
+    def _write_tail(self, data: bytes):
+        size = self.tail_bytes
+        if len(data) >= size:
+            self.tail[:] = data[-size:]
+            self.tail_pos = 0
+            self.tail_len = size
+            return
+
+        first = min(len(data), size - self.tail_pos)
+        self.tail[self.tail_pos:self.tail_pos + first] = data[:first]
+        self.tail[:len(data) - first] = data[first:]
+        self.tail_pos = (self.tail_pos + len(data)) % size
+        self.tail_len = min(size, self.tail_len + len(data))
+
+    def _tail_data(self) -> bytes:
+        if self.tail_len < self.tail_bytes:
+            return bytes(self.tail[:self.tail_len])
+        return bytes(self.tail[self.tail_pos:] + self.tail[:self.tail_pos])
+
+    @property
+    def omitted(self) -> int:
+        return self.total - len(self.head) - self.tail_len
+
+    def text(self) -> str:
+        """Captured output, with a note about the bytes left out in the middle"""
+        if self.omitted:
+            head = self.head.decode('utf-8', errors='replace')
+            tail = self._tail_data().decode('utf-8', errors='replace')
+            output = f"{head}\n\n… {self.omitted} bytes omitted …\n\n{tail}"
+        else:
+            # Nothing is missing, so a character split between the buffers stays whole
+            output = (bytes(self.head) + self._tail_data()).decode('utf-8', errors='replace')
+
+        if self.limit_reached:
+            output = output.rstrip() + f"\n\n⚠️ Output exceeded {self.limit} bytes, the command was stopped"
+        return output
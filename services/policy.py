@@ -0,0 +1,510 @@
+import fnmatch
+import json
+import os
+import posixpath
+import re
+import sys
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Dict, Iterator, List, Optional, Tuple
+from config.config import config
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Shell words (with quoting) and operators, longest operators first; anything
+# else is an unbalanced quote. '<(' and '>(' start a process substitution,
+# not a redirection
+TOKEN_PATTERN = re.compile(r"""
+    [ \t\r\f\v]*
+    (?: (?P<redirect>&>>|&>|>>|>&|>\||<<<|<<|<>|<&|[<>](?!\())
+  | (?P<operator>&&|\|\||;;|\|&|\(\)|[<>]\(|[;|&()\n`])
+  | (?P<word>(?:\$'(?:[^'\\]|\\.)*'|\$?"(?:[^"\\]|\\.)*"|'[^']*'|[^\s;|&()<>`'"\\]|\\.)+)
+  | (?P<error>\S) )
+""", re.VERBOSE | re.DOTALL)
+# $'...' (ANSI-C), '...', "..." and $"..." (same as "..."), backslash escape
+QUOTING_PATTERN = re.compile(r"""\$'((?:[^'\\]|\\.)*)'|'([^']*)'|\$?"((?:[^"\\]|\\.)*)"|\\(.)""", re.DOTALL)
+DOUBLE_QUOTE_ESCAPE = re.compile(r'\\([$`"\\\n])')
+ANSI_C_ESCAPE = re.compile(r'\\(?:x([0-9a-fA-F]{1,2})|u([0-9a-fA-F]{1,4})|U([0-9a-fA-F]{1,8})|([0-7]{1,3})|c(.)|(.))', re.DOTALL)
+ANSI_C_CHARS = {
+    'a': '\a', 'b': '\b', 'e': '\x1b', 'E': '\x1b', 'f': '\f', 'n': '\n', 'r': '\r',
+    't': '\t', 'v': '\v', '\\': '\\', "'": "'", '"': '"', '?': '?'
+}
+SEPARATORS = frozenset({';', '|', '||', '&', '&&', '|&', ';;', '(', ')', '()', '<(', '>(', '\n', '`', '{', '}'})
+KEYWORDS = frozenset({'if', 'then', 'else', 'elif', 'do', 'while', 'until', '!', 'time'})
+SHELLS = frozenset({'sh', 'bash', 'dash', 'zsh', 'ksh', 'ash'})
+
+# Commands that run their arguments as another command, with the options taking a value
+WRAPPERS = {
+    'sudo': frozenset({'-u', '-g', '-C', '-D', '-h', '-p', '-r', '-t', '-U', '-T'}),
+    'doas': frozenset({'-u', '-C'}),
+    'env': frozenset({'-u', '-C', '-S'}),
+    'nice': frozenset({'-n'}),
+    'ionice': frozenset({'-c', '-n', '-p'}),
+    'timeout': frozenset({'-s', '-k'}),
+    'stdbuf': frozenset({'-i', '-o', '-e'}),
+    'xargs': frozenset({'-a', '-d', '-E', '-I', '-L', '-n', '-P', '-s'}),
+    'nohup': frozenset(),
+    'setsid': frozenset(),
+    'command': frozenset(),
+    'exec': frozenset(),
+    'builtin': frozenset(),
+}
+ASSIGNMENT_PATTERN = re.compile(r'[A-Za-z_][A-Za-z0-9_]*=')
+SHORT_FLAGS_PATTERN = re.compile(r'-[A-Za-z]{2,}')
+MAX_NESTING = 3
+
+@dataclass
+class PolicyRule:
+    name: str
+    action: str  # 'allow' or 'deny'
+    command: Optional[str] = None  # glob for the program name
+    args: Tuple[str, ...] = ()  # globs that must all appear among the arguments
+    regex: Optional[str] = None  # matched against the whole command line instead
+    users: frozenset = frozenset()  # empty means every user
+    hosts: Tuple[str, ...] = ()  # globs, empty means every host
+
+    def applies_to(self, user_id: Optional[int], host: str) -> bool:
+        if self.users and user_id not in self.users:
+            return False
+        return not self.hosts or any(fnmatch.fnmatchcase(host, pattern) for pattern in self.hosts)
+
+@dataclass
+class CompiledPolicy:
+    """Rules for one user and host, compiled into a few combined regexes
+
+    Every rule is one named group and the first matching rule in file order
+    wins, whether it is a regex over the whole line or a token rule for one
+    command. Token rules are grouped by literal program name, so a lookup
+    only tries the rules for that program plus the ones with a wildcard
+    program, however large the rule set is. Per-program regexes are compiled
+    on first use.
+    """
+    rules: List[PolicyRule]
+    line_regex: Optional[re.Pattern] = None
+    wildcard_regex: Optional[re.Pattern] = None
+    program_rules: Dict[str, List[int]] = field(default_factory=dict)  # program -> rule indexes
+    by_program: Dict[str, re.Pattern] = field(default_factory=dict)
+
+    def program_regex(self, program: str) -> Optional[re.Pattern]:
+        regex = self.by_program.get(program)
+        if regex is None and program in self.program_rules:
+            regex = self.by_program[program] = combine_rules(self.rules, self.program_rules[program])
+        return regex
+
+class CommandPolicy:
+    """Allow and deny rules for commands, loaded from a JSON file
+
+    The file is re-read when its mtime changes. Verdicts are cached per user,
+    host and command line until the next reload.
+    """
+
+    def __init__(self, path: str, cache_size: int = 4096):
+        self.path = path
+        self.cache_size = cache_size
+        self.default_action = 'allow'
+        self.rules: List[PolicyRule] = []
+        self._compiled: Dict[Tuple[Optional[int], str], CompiledPolicy] = {}
+        self._mtime: Optional[float] = None
+        self._cached_check = lru_cache(maxsize=cache_size)(self._check)
+
+    def refresh(self) -> bool:
+        """Reload the rules if the file changed, return True if it did"""
+        try:
+            mtime = os.stat(self.path).st_mtime
+        except OSError as e:
+            logger.error(f"Policy file unavailable: {e}")
+            return False
+
+        if mtime == self._mtime:
+            return False
+
+        try:
+            with open(self.path, encoding='utf-8') as file:
+                default_action, rules = self._parse(json.load(file))
+        except (OSError, ValueError, KeyError, TypeError, re.error) as e:
+            # Keep enforcing the previous rules until the file is fixed
+            logger.error(f"Failed to load policy from {self.path}: {e}")
+            self._mtime = mtime
+            return False
+
+        self.default_action = default_action
+        self.rules = rules
+        self._compiled = {}
+        self._cached_check = lru_cache(maxsize=self.cache_size)(self._check)
+        self._mtime = mtime
+        logger.info(f"Loaded {len(rules)} policy rules from {self.path}")
+        return True
+
+    def check(self, command: str, user_id: Optional[int] = None, host: Optional[str] = None) -> Tuple[bool, str]:
+        """Decide whether user may run command on host, return (allowed, reason)"""
+        self.refresh()
+        return self._cached_check(command, user_id, host or config.SSH_HOST)
+
+    def _check(self, command: str, user_id: Optional[int], host: str) -> Tuple[bool, str]:
+        compiled = self._compiled.get((user_id, host))
+        if compiled is None:
+            compiled = self._compiled[(user_id, host)] = self._compile(
+                [rule for rule in self.rules if rule.applies_to(user_id, host)]
+            )
+
+        return self._check_line(compiled, command, 0)
+
+    def _check_line(self, compiled: CompiledPolicy, line: str, depth: int,
+                    inherited: Tuple[int, ...] = ()) -> Tuple[bool, str]:
+        # Regex rules match the whole line, including the line a nested
+        # command came from, so they compete with the token rules of every
+        # command in it
+        line_indexes = inherited + line_matches(compiled, line)
+
+        try:
+            tokens = tokenize(line)
+        except ValueError as e:
+            if line_indexes:
+                return self._verdict(compiled.rules[min(line_indexes)])
+            return False, f"🚫 Could not parse the command: {e}"
+
+        checked = False
+        for segment in split_commands(tokens):
+            words = [word for word in segment if not word.startswith(('<', '>'))]
+            if not words:
+                continue
+            checked = True
+
+            # Program first, even when the command line starts with a redirection
+            redirects = [word for word in segment if word.startswith(('<', '>'))]
+            allowed, reason = self._check_segment(
+                compiled, [normalize_word(word) for word in words + redirects], line_indexes
+            )
+            if not allowed:
+                return False, reason
+
+            # Commands passed as a string to a shell or eval are checked as well
+            nested = nested_command(words, redirects)
+            if nested is not None:
+                allowed, reason = self._check_nested(compiled, nested, depth, line_indexes)
+                if not allowed:
+                    return False, reason
+
+        # "$(...)" and "`...`" are part of a quoted word to the tokenizer
+        for substitution in quoted_substitutions(line):
+            allowed, reason = self._check_nested(compiled, substitution, depth, line_indexes)
+            if not allowed:
+                return False, reason
+
+        # Nothing but redirections: only the regex rules can apply
+        if not checked and line_indexes:
+            return self._verdict(compiled.rules[min(line_indexes)])
+        return True, ""
+
+    def _check_nested(self, compiled: CompiledPolicy, line: str, depth: int,
+                      line_indexes: Tuple[int, ...]) -> Tuple[bool, str]:
+        if depth >= MAX_NESTING:
+            return False, "🚫 Too many nested shell commands"
+        return self._check_line(compiled, line, depth + 1, line_indexes)
+
+    def _check_segment(self, compiled: CompiledPolicy, segment: List[str],
+                       line_indexes: Tuple[int, ...]) -> Tuple[bool, str]:
+        program = segment[0]
+        form = canonical_form(segment)
+
+        # The rule earliest in the file wins, whether it is a line regex,
+        # names the program or has a glob
+        indexes = list(line_indexes)
+        for regex in (compiled.program_regex(program), compiled.wildcard_regex):
+            match = regex.match(form) if regex is not None else None
+            if match:
+                indexes.append(int(match.lastgroup[1:]))
+
+        if indexes:
+            return self._verdict(compiled.rules[min(indexes)])
+
+        if self.default_action == 'deny':
+            return False, f"🚫 '{program}' is not allowed by policy"
+        return True, ""
+
+    def _verdict(self, rule: PolicyRule) -> Tuple[bool, str]:
+        if rule.action == 'deny':
+            return False, f"🚫 Blocked by policy rule '{rule.name}'"
+        return True, ""
+
+    def _compile(self, rules: List[PolicyRule]) -> CompiledPolicy:
+        """Combine the rules into one regex per program name"""
+        compiled = CompiledPolicy(rules=rules)
+
+        # One optional lookahead per rule, so a single match at the start
+        # reports every regex rule found anywhere in the line
+        line_parts = [
+            f"(?:(?=[\\s\\S]*?(?P<r{index}>{rule.regex})))?"
+            for index, rule in enumerate(rules) if rule.regex
+        ]
+        if line_parts:
+            compiled.line_regex = re.compile(''.join(line_parts))
+
+        wildcard = []
+        for index, rule in enumerate(rules):
+            if rule.regex:
+                continue
+            if has_magic(rule.command):
+                wildcard.append(index)
+            else:
+                compiled.program_rules.setdefault(rule.command, []).append(index)
+
+        compiled.wildcard_regex = combine_rules(rules, wildcard)
+        return compiled
+
+    def _parse(self, data: dict) -> Tuple[str, List[PolicyRule]]:
+        """Validate raw policy data"""
+        default_action = data.get('default', 'allow')
+        if default_action not in ('allow', 'deny'):
+            raise ValueError(f"invalid default action '{default_action}'")
+
+        rules = []
+        for index, item in enumerate(data['rules']):
+            name = item.get('name', f"#{index + 1}")
+            action = item['action']
+            if action not in ('allow', 'deny'):
+                raise ValueError(f"invalid action '{action}' in rule '{name}'")
+            if ('regex' in item) == ('command' in item):
+                raise ValueError(f"rule '{name}' needs either 'command' or 'regex'")
+
+            regex = item.get('regex')
+            if regex is not None:
+                # Fail on the rule itself, not later in the combined pattern
+                if re.compile(regex).groups:
+                    raise ValueError(f"regex of rule '{name}' must not use capturing groups, use (?:...)")
+
+            rules.append(PolicyRule(
+                name=name,
+                action=action,
+                command=item.get('command'),
+                args=tuple(item.get('args', ())),
+                regex=regex,
+                users=frozenset(int(user_id) for user_id in item.get('users', ())),
+                hosts=tuple(item.get('hosts', ()))
+            ))
+
+        return default_action, rules
+
+def tokenize(line: str) -> List[str]:
+    """Split a command line into words and operators like the shell would
+
+    One regex pass, several times faster than shlex. Quotes and escapes are
+    removed from words. Redirections are joined with their target ('>'
+    '/dev/sda' -> '>/dev/sda') and clusters of short flags are expanded
+    ('-rf' -> '-r' '-f'), so rules don't depend on spacing or flag order.
+    """
+    tokens = []
+    redirect = None
+
+    for match in TOKEN_PATTERN.finditer(line.replace('\0', '')):
+        kind = match.lastgroup
+        if kind == 'error':
+            raise ValueError("No closing quotation")
+        token = match.group(kind)
+        if kind == 'word' and ('\'' in token or '"' in token or '\\' in token):
+            token = QUOTING_PATTERN.sub(unquote, token)
+
+        if redirect is not None:
+            tokens.append(redirect + token)
+            redirect = None
+        elif kind == 'redirect':
+            # Here-strings keep their operator, a shell runs them as a script
+            redirect = '<<<' if token == '<<<' else '>' if '>' in token else '<'
+        elif SHORT_FLAGS_PATTERN.fullmatch(token):
+            tokens.extend(f"-{flag}" for flag in token[1:])
+        else:
+            tokens.append(token)
+    return tokens
+
+def unquote(match: re.Match) -> str:
+    ansi_c, single, double, escaped = match.groups()
+    if ansi_c is not None:
+        return ANSI_C_ESCAPE.sub(ansi_c_escape, ansi_c)
+    if single is not None:
+        return single
+    if double is not None:
+        return DOUBLE_QUOTE_ESCAPE.sub(r'\1', double)
+    return escaped
+
+def ansi_c_escape(match: re.Match) -> str:
+    """Decode one backslash escape inside $'...'"""
+    hex_code, short_unicode, long_unicode, octal, control, char = match.groups()
+    if control is not None:
+        return chr(ord(control) & 0x1f)
+    if char is not None:
+        return ANSI_C_CHARS.get(char, '\\' + char)
+    if octal is not None:
+        code = int(octal, 8) & 0xff
+    else:
+        code = int(hex_code or short_unicode or long_unicode, 16)
+    return chr(code) if 0 < code <= sys.maxunicode else ''
+
+def line_matches(compiled: CompiledPolicy, line: str) -> Tuple[int, ...]:
+    """Indexes of every regex rule that matches somewhere in the line"""
+    if compiled.line_regex is None:
+        return ()
+    groups = compiled.line_regex.match(line).groupdict()
+    return tuple(int(name[1:]) for name, value in groups.items() if value is not None)
+
+def normalize_word(word: str) -> str:
+    """'//', '/.' and '/tmp/..' become '/', also for redirection targets"""
+    prefix = word[:1] if word.startswith(('<', '>')) else ''
+    path = word[len(prefix):]
+    if not path.startswith('/'):
+        return word
+    # normpath keeps a leading '//', so collapse repeated slashes first
+    return prefix + posixpath.normpath(re.sub(r'/{2,}', '/', path))
+
+def split_commands(tokens: List[str]) -> Iterator[List[str]]:
+    """Yield simple commands, without assignments, keywords and wrappers like sudo
+
+    A wrapped command is yielded twice: as written and as the inner command,
+    so rules can match either ('sudo' or 'rm').
+    """
+    segment = []
+    for token in tokens + [';']:
+        if token not in SEPARATORS:
+            segment.append(token)
+            continue
+
+        while segment and (segment[0] in KEYWORDS or ASSIGNMENT_PATTERN.match(segment[0])):
+            segment.pop(0)
+        while segment:
+            segment[0] = os.path.basename(segment[0]) or segment[0]
+            yield segment
+            segment = unwrap(segment)
+        segment = []
+
+def unwrap(segment: List[str]) -> List[str]:
+    """Command run by a wrapper such as sudo, or an empty list"""
+    value_options = WRAPPERS.get(segment[0])
+    if value_options is None:
+        return []
+
+    index = 1
+    positional = 1 if segment[0] == 'timeout' else 0  # the duration
+    while index < len(segment):
+        word = segment[index]
+        if word in value_options:
+            index += 2
+        elif word.startswith('-') or (segment[0] == 'env' and ASSIGNMENT_PATTERN.match(word)):
+            index += 1
+        elif positional:
+            positional -= 1
+            index += 1
+        else:
+            break
+    return segment[index:]
+
+def nested_command(words: List[str], redirects: List[str] = ()) -> Optional[str]:
+    """Command string given to 'sh -c', to a shell as a here-string, or to eval"""
+    if words[0] == 'eval' and len(words) > 1:
+        return ' '.join(words[1:])
+    if words[0] in SHELLS:
+        for index, word in enumerate(words[1:-1], start=1):
+            if word == '-c':
+                return words[index + 1]
+        for redirect in redirects:
+            if redirect.startswith('<<<'):
+                return redirect[3:]
+    return None
+
+def quoted_substitutions(line: str) -> List[str]:
+    """Commands in $(...) and `...` inside double-quoted parts of words"""
+    if '"' not in line or ('$(' not in line and '`' not in line):
+        return []
+
+    commands = []
+    for match in TOKEN_PATTERN.finditer(line):
+        word = match.group('word')
+        if not word or '"' not in word:
+            continue
+        # finditer consumes '...' and $'...' whole, so only real double quotes count
+        for part in QUOTING_PATTERN.finditer(word):
+            double = part.group(3)
+            if double:
+                commands.extend(command_substitutions(double))
+    return commands
+
+def command_substitutions(text: str) -> List[str]:
+    """Bodies of unescaped $(...) and `...` in the text of a double-quoted string"""
+    commands = []
+    index = 0
+    while index < len(text):
+        if text[index] == '\\':
+            index += 2
+        elif text.startswith('$(', index):
+            depth = 1
+            end = index + 2
+            while end < len(text) and depth:
+                if text[end] == '\\':
+                    end += 1
+                elif text[end] == '(':
+                    depth += 1
+                elif text[end] == ')':
+                    depth -= 1
+                end += 1
+            commands.append(text[index + 2:end - 1 if not depth else end])
+            index = end
+        elif text[index] == '`':
+            end = index + 1
+            while end < len(text) and text[end] != '`':
+                end += 2 if text[end] == '\\' else 1
+            commands.append(DOUBLE_QUOTE_ESCAPE.sub(r'\1', text[index + 1:end]))
+            index = end + 1
+        else:
+            index += 1
+    return commands
+
+def canonical_form(segment: List[str]) -> str:
+    """'\\0rm\\0-r\\0-f\\0/\\0': NUL can't appear inside a shell word"""
+    return '\0' + '\0'.join(segment) + '\0'
+
+def has_magic(pattern: str) -> bool:
+    return any(char in pattern for char in '*?[')
+
+def glob_to_regex(pattern: str) -> str:
+    """Translate a glob for one word, wildcards never cross word boundaries"""
+    parts = []
+    index = 0
+    while index < len(pattern):
+        char = pattern[index]
+        if char == '*':
+            parts.append('[^\0]*')
+        elif char == '?':
+            parts.append('[^\0]')
+        elif char == '[' and ']' in pattern[index + 2:]:
+            end = pattern.index(']', index + 2)
+            body = pattern[index + 1:end]
+            if body.startswith('!'):
+                body = '^' + body[1:]
+            parts.append(f"[{body.replace(chr(92), chr(92) * 2)}]")
+            index = end
+        else:
+            parts.append(re.escape(char))
+        index += 1
+    return ''.join(parts)
+
+def combine_rules(rules: List[PolicyRule], indexes: List[int]) -> Optional[re.Pattern]:
+    """One anchored regex with a named alternative per rule, in file order"""
+    if not indexes:
+        return None
+    return re.compile(
+        '|'.join(f"(?P<r{index}>{token_rule_pattern(rules[index])})" for index in indexes),
+        re.DOTALL
+    )
+
+def token_rule_pattern(rule: PolicyRule) -> str:
+    """Regex over canonical_form: the program, then every argument in any order"""
+    args = []
+    for arg in rule.args:
+        if not has_magic(arg) and SHORT_FLAGS_PATTERN.fullmatch(arg):
+            args.extend(f"-{flag}" for flag in arg[1:])
+        else:
+            args.append(arg)
+
+    lookaheads = ''.join(f"(?=.*\0{glob_to_regex(arg)}\0)" for arg in args)
+    return f"\0{glob_to_regex(rule.command)}(?=\0){lookaheads}"
+
+command_policy = CommandPolicy(config.POLICY_FILE)
@@ -0,0 +1,206 @@
+import asyncio
+import os
+import sys
+import tempfile
+import threading
+import time
+import traceback
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+from config.config import config
+import logging
+
+logger = logging.getLogger(__name__)
+
+MAX_STACK_DEPTH = 64
+MAX_SLOW_CALLBACKS = 50
+LAG_CHECK_INTERVAL = 0.05
+
+@dataclass
+class Timing:
+    count: int = 0
+    total: float = 0.0
+    max: float = 0.0
+
+    def add(self, duration: float):
+        self.count += 1
+        self.total += duration
+        self.max = max(self.max, duration)
+
+@dataclass
+class ProfileWindow:
+    """Everything collected between /profile start and stop"""
+    started: float  # wall clock
+    started_monotonic: float
+    samples: Counter = field(default_factory=Counter)  # stack tuple -> count
+    sample_count: int = 0
+    timings: Dict[Tuple[str, str], Timing] = field(default_factory=dict)
+    lag: Timing = field(default_factory=Timing)
+    slow_callbacks: List[Tuple[float, str]] = field(default_factory=list)  # (lag, stack)
+
+class Profiler:
+    """On-demand sampling profiler and event loop lag monitor
+
+    While active, a thread samples the event loop thread's stack every
+    PROFILE_SAMPLE_INTERVAL seconds and a task measures how late the loop
+    wakes up. When the loop is stuck for longer than PROFILE_SLOW_THRESHOLD
+    the thread saves the blocking stack. Handlers, Telegram requests and SSH
+    calls report their durations through record(). While inactive nothing
+    runs and every hook is a single attribute check.
+    """
+
+    def __init__(self, sample_interval: float, slow_threshold: float):
+        self.sample_interval = sample_interval
+        self.slow_threshold = slow_threshold
+        self.active = False
+        self.window: Optional[ProfileWindow] = None
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._lag_task: Optional[asyncio.Task] = None
+        self._loop_thread_id: Optional[int] = None
+        self._heartbeat = 0.0
+        self._blocked_stack: Optional[str] = None
+
+    def start(self) -> bool:
+        """Start profiling, must be called from the event loop; False if already running"""
+        if self.active:
+            return False
+
+        self.window = ProfileWindow(started=time.time(), started_monotonic=time.monotonic())
+        self._loop_thread_id = threading.get_ident()
+        self._heartbeat = time.monotonic()
+        self._blocked_stack = None
+        self._stop_event.clear()
+
+        self._thread = threading.Thread(target=self._sample, name="profiler", daemon=True)
+        self._thread.start()
+        self._lag_task = asyncio.ensure_future(self._watch_loop())
+        self.active = True
+        logger.info("Profiling started")
+        return True
+
+    def stop(self) -> Optional[ProfileWindow]:
+        """Stop profiling and return what was collected, None if not running"""
+        if not self.active:
+            return None
+
+        self.active = False
+        self._stop_event.set()
+        self._lag_task.cancel()
+        self._thread.join()
+        window, self.window = self.window, None
+        logger.info(f"Profiling stopped after {time.monotonic() - window.started_monotonic:.1f}s, {window.sample_count} samples")
+        return window
+
+    def record(self, category: str, name: str, duration: float):
+        """Add one timed call; callers check `active` first to stay free when off"""
+        window = self.window
+        if window is None:
+            return
+        timing = window.timings.get((category, name))
+        if timing is None:
+            timing = window.timings[(category, name)] = Timing()
+        timing.add(duration)
+
+    def _sample(self):
+        """Sampling thread: stack of the loop thread, plus the blocking stack on stalls"""
+        window = self.window
+        while not self._stop_event.wait(self.sample_interval):
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if frame is None:
+                continue
+
+            stack = []
+            current = frame
+            while current is not None and len(stack) < MAX_STACK_DEPTH:
+                code = current.f_code
+                stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                current = current.f_back
+            window.samples[tuple(reversed(stack))] += 1
+            window.sample_count += 1
+
+            # The loop hasn't run the lag task for too long: something is blocking it right now
+            if self._blocked_stack is None and time.monotonic() - self._heartbeat > self.slow_threshold + LAG_CHECK_INTERVAL:
+                self._blocked_stack = ''.join(traceback.format_stack(frame, limit=MAX_STACK_DEPTH))
+            del frame, current
+
+    async def _watch_loop(self):
+        """Measure how late the loop wakes up from a short sleep"""
+        window = self.window
+        loop = asyncio.get_running_loop()
+        while True:
+            before = loop.time()
+            await asyncio.sleep(LAG_CHECK_INTERVAL)
+            lag = max(0.0, loop.time() - before - LAG_CHECK_INTERVAL)
+            self._heartbeat = time.monotonic()
+            window.lag.add(lag)
+
+            if lag > self.slow_threshold:
+                stack, self._blocked_stack = self._blocked_stack, None
+                if len(window.slow_callbacks) < MAX_SLOW_CALLBACKS:
+                    window.slow_callbacks.append((lag, stack or "(stack not captured, the stall ended before the next sample)\n"))
+            else:
+                self._blocked_stack = None
+
+def write_report(window: ProfileWindow, sample_interval: float, slow_threshold: float) -> Tuple[str, str]:
+    """Write the text report and the folded stacks, return both paths
+
+    The .folded file is the collapsed stack format used by flamegraph.pl
+    and speedscope.
+    """
+    duration = time.monotonic() - window.started_monotonic
+    stamp = time.strftime('%Y%m%dT%H%M%S', time.localtime(window.started))
+    lines = [
+        f"Profile started {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(window.started))}, "
+        f"{duration:.1f}s, {window.sample_count} samples every {sample_interval * 1000:.0f}ms",
+        "",
+        "== Event loop lag ==",
+        f"checks: {window.lag.count}, mean: {window.lag.total / max(window.lag.count, 1) * 1000:.1f}ms, "
+        f"max: {window.lag.max * 1000:.1f}ms, stalls over {slow_threshold * 1000:.0f}ms: {len(window.slow_callbacks)}",
+    ]
+
+    for lag, stack in sorted(window.slow_callbacks, key=lambda item: item[0], reverse=True):
+        lines += ["", f"-- loop blocked for {lag * 1000:.0f}ms in:", stack.rstrip()]
+
+    categories = sorted({category for category, _ in window.timings})
+    for category in categories:
+        rows = sorted(
+            ((name, timing) for (row_category, name), timing in window.timings.items() if row_category == category),
+            key=lambda row: row[1].total,
+            reverse=True
+        )
+        lines += ["", f"== {category} ==", f"{'calls':>7} {'total s':>9} {'mean ms':>9} {'max ms':>9}  name"]
+        for name, timing in rows:
+            lines.append(
+                f"{timing.count:>7} {timing.total:>9.3f} {timing.total / timing.count * 1000:>9.1f} "
+                f"{timing.max * 1000:>9.1f}  {name}"
+            )
+
+    # Self time is the innermost frame, total time counts a function once per sample
+    self_counts = Counter()
+    total_counts = Counter()
+    for stack, count in window.samples.items():
+        if stack:
+            self_counts[stack[-1]] += count
+        for function in set(stack):
+            total_counts[function] += count
+
+    sample_count = max(window.sample_count, 1)
+    for title, counts in (("Sampled self time", self_counts), ("Sampled total time", total_counts)):
+        lines += ["", f"== {title} (top 30) ==", f"{'samples':>8} {'%':>6}  function"]
+        for function, count in counts.most_common(30):
+            lines.append(f"{count:>8} {count / sample_count * 100:>5.1f}%  {function}")
+
+    report_path = os.path.join(tempfile.gettempdir(), f"tgbot-profile-{stamp}.txt")
+    with open(report_path, 'w', encoding='utf-8') as file:
+        file.write("\n".join(lines) + "\n")
+
+    folded_path = os.path.join(tempfile.gettempdir(), f"tgbot-profile-{stamp}.folded")
+    with open(folded_path, 'w', encoding='utf-8') as file:
+        for stack, count in window.samples.most_common():
+            file.write(f"{';'.join(stack)} {count}\n")
+
+    return report_path, folded_path
+
+profiler = Profiler(config.PROFILE_SAMPLE_INTERVAL, config.PROFILE_SLOW_THRESHOLD)
@@ -0,0 +1,180 @@
+import asyncio
+import json
+import os
+import re
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+from config.config import config
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Keeps "quick_cmd:<id>" well inside Telegram's 64-byte callback_data limit
+COMMAND_ID_PATTERN = re.compile(r'[A-Za-z0-9_-]{1,32}')
+# Seconds before a step is killed on the server, same defaults as execute_command
+# and execute_large_output; long jobs like apt upgrade set their own
+DEFAULT_TIMEOUT = 30
+LARGE_OUTPUT_TIMEOUT = 300
+
+@dataclass
+class MacroStep:
+    id: str
+    command: str
+    needs: Tuple[str, ...] = ()
+
+@dataclass
+class QuickCommand:
+    id: str
+    title: str
+    steps: List[MacroStep] = field(default_factory=list)  # topologically sorted
+    large_output: bool = False  # send big output as a .txt.gz attachment
+    output_limit: Optional[int] = None  # overrides OUTPUT_LIMIT_BYTES
+    timeout: int = DEFAULT_TIMEOUT  # per step, in seconds
+
+    @property
+    def is_macro(self) -> bool:
+        return len(self.steps) > 1
+
+class QuickCommandRegistry:
+    """Quick commands and multi-step macros loaded from a JSON file
+
+    The file is re-read only when its mtime changes. Every successful reload
+    bumps `version`, which keyboards use to know when to rebuild.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.commands: Dict[str, QuickCommand] = {}
+        self.version = 0
+        self._mtime: Optional[float] = None
+
+    def refresh(self) -> bool:
+        """Reload the registry if the file changed, return True if it did"""
+        try:
+            mtime = os.stat(self.path).st_mtime
+        except OSError as e:
+            logger.error(f"Quick commands file unavailable: {e}")
+            return False
+
+        if mtime == self._mtime:
+            return False
+
+        try:
+            with open(self.path, encoding='utf-8') as file:
+                commands = self._parse(json.load(file))
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            # Keep serving the previous registry until the file is fixed
+            logger.error(f"Failed to load quick commands from {self.path}: {e}")
+            self._mtime = mtime
+            return False
+
+        self.commands = commands
+        self._mtime = mtime
+        self.version += 1
+        logger.info(f"Loaded {len(commands)} quick commands from {self.path}")
+        return True
+
+    def get(self, command_id: str) -> Optional[QuickCommand]:
+        """Get quick command by id"""
+        self.refresh()
+        return self.commands.get(command_id)
+
+    def _parse(self, data: dict) -> Dict[str, QuickCommand]:
+        """Validate raw registry data and sort macro steps by dependencies"""
+        commands: Dict[str, QuickCommand] = {}
+
+        for item in data['commands']:
+            command_id = item['id']
+            if not COMMAND_ID_PATTERN.fullmatch(command_id):
+                raise ValueError(f"invalid quick command id '{command_id}'")
+            if command_id in commands:
+                raise ValueError(f"duplicate quick command id '{command_id}'")
+
+            large_output = bool(item.get('large_output', False))
+            if large_output and 'steps' in item:
+                raise ValueError(f"large_output is only supported for single commands, not macro '{command_id}'")
+
+            if 'steps' in item:
+                steps = [
+                    MacroStep(id=step['id'], command=step['command'], needs=tuple(step.get('needs', ())))
+                    for step in item['steps']
+                ]
+            else:
+                steps = [MacroStep(id=command_id, command=item['command'])]
+
+            if not steps:
+                raise ValueError(f"quick command '{command_id}' has no steps")
+
+            output_limit = item.get('output_limit')
+            if output_limit is not None and (not isinstance(output_limit, int) or output_limit < 0):
+                raise ValueError(f"output_limit of '{command_id}' must be a non-negative integer")
+
+            timeout = item.get('timeout', LARGE_OUTPUT_TIMEOUT if large_output else DEFAULT_TIMEOUT)
+            if not isinstance(timeout, int) or timeout <= 0:
+                raise ValueError(f"timeout of '{command_id}' must be a positive integer")
+
+            commands[command_id] = QuickCommand(
+                id=command_id,
+                title=item['title'],
+                steps=self._sort_steps(command_id, steps),
+                large_output=large_output,
+                output_limit=output_limit,
+                timeout=timeout
+            )
+
+        return commands
+
+    def _sort_steps(self, command_id: str, steps: List[MacroStep]) -> List[MacroStep]:
+        """Order steps so every step comes after its dependencies (Kahn's algorithm)"""
+        by_id = {step.id: step for step in steps}
+        if len(by_id) != len(steps):
+            raise ValueError(f"duplicate step ids in '{command_id}'")
+
+        for step in steps:
+            unknown = set(step.needs) - by_id.keys()
+            if unknown:
+                raise ValueError(f"step '{step.id}' in '{command_id}' needs unknown steps: {', '.join(sorted(unknown))}")
+
+        pending = {step.id: set(step.needs) for step in steps}
+        ordered = []
+
+        while pending:
+            ready = [step_id for step_id, needs in pending.items() if not needs]
+            if not ready:
+                raise ValueError(f"dependency cycle in '{command_id}': {', '.join(sorted(pending))}")
+
+            for step_id in ready:
+                ordered.append(by_id[step_id])
+                del pending[step_id]
+            for needs in pending.values():
+                needs.difference_update(ready)
+
+        return ordered
+
+async def run_quick_command(
+    quick_command: QuickCommand,
+    execute: Callable[[str, int], Awaitable[Tuple[bool, str]]]
+) -> List[Tuple[MacroStep, bool, str]]:
+    """Run all steps, each as soon as its dependencies have succeeded
+
+    execute(command, timeout) runs one step with the entry's timeout.
+
+    Independent steps run concurrently. A step whose dependency failed is
+    skipped and counts as failed, so its own dependents are skipped too.
+    """
+    tasks: Dict[str, asyncio.Task] = {}
+
+    async def run_step(step: MacroStep) -> Tuple[bool, str]:
+        results = await asyncio.gather(*(tasks[dep] for dep in step.needs))
+        if not all(success for success, _ in results):
+            return False, "⏭ Skipped: a required step failed"
+        return await execute(step.command, quick_command.timeout)
+
+    # Steps are topologically sorted, so dependency tasks always exist already
+    for step in quick_command.steps:
+        tasks[step.id] = asyncio.ensure_future(run_step(step))
+
+    results = await asyncio.gather(*tasks.values())
+    return [(step, success, output) for step, (success, output) in zip(quick_command.steps, results)]
+
+quick_commands = QuickCommandRegistry(config.QUICK_COMMANDS_FILE)
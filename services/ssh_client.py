@@ -1,166 +1,542 @@
 import asyncssh
 import asyncio
+import os
+import re
+import shlex
+import tempfile
+import time
+import uuid
 from typing import Optional, Tuple, Dict
 from config.config import config
+from services.audit import audit_log
+from services.output_capture import OutputCapture
+from services.policy import command_policy
+from services.profiler import profiler
 import logging
-import os
 
 logger = logging.getLogger(__name__)
 
+READ_CHUNK_SIZE = 64 * 1024
+
+class CommandCancelled(Exception):
+    """Raised when a running command is cancelled by the user"""
+
 class StatefulSSHClient:
     def __init__(self):
         self.sessions: Dict[int, dict] = {}  # user_id -> session data
         self.single_connection: Optional[asyncssh.SSHClientConnection] = None
+        self.running: Dict[str, dict] = {}  # command_id -> running command
+    
+    def _get_connection_args(self) -> dict:
+        """Build asyncssh connection arguments from config"""
+        conn_args = {
+            'host': config.SSH_HOST,
+            'port': config.SSH_PORT,
+            'username': config.SSH_USERNAME,
+        }
+        
+        if config.SSH_PASSWORD:
+            conn_args['password'] = config.SSH_PASSWORD
+        elif config.SSH_KEY_PATH:
+            conn_args['client_keys'] = [config.SSH_KEY_PATH]
+        
+        # zlib pays off on text-heavy output over slow links, 'none' stays as fallback
+        if config.SSH_COMPRESSION:
+            conn_args['compression_algs'] = ['zlib@openssh.com', 'zlib', 'none']
+        else:
+            conn_args['compression_algs'] = ['none']
+        
+        return conn_args
     
     async def connect(self) -> bool:
         """Establish single SSH connection"""
+        started = time.monotonic()
         try:
-            conn_args = {
-                'host': config.SSH_HOST,
-                'port': config.SSH_PORT,
-                'username': config.SSH_USERNAME,
-            }
-            
-            if config.SSH_PASSWORD:
-                conn_args['password'] = config.SSH_PASSWORD
-            elif config.SSH_KEY_PATH:
-                conn_args['client_keys'] = [config.SSH_KEY_PATH]
-            
-            self.single_connection = await asyncssh.connect(**conn_args)
+            self.single_connection = await asyncssh.connect(**self._get_connection_args())
             logger.info(f"SSH connection established to {config.SSH_HOST}")
             return True
             
         except Exception as e:
             logger.error(f"SSH connection failed: {e}")
             return False
+        finally:
+            self._profile('connect', started)
     
-    async def execute_command(self, command: str, timeout: int = 30) -> Tuple[bool, str]:
-        """Execute single command"""
+    async def run_internal(self, command: str, timeout: float = 15) -> Optional[str]:
+        """Run a helper command of the bot itself on the shared connection
+        
+        Not user input, so there is no policy check, audit record or output
+        capture: the command has to bound its own output. Returns None on error.
+        """
         if not self.single_connection:
             success = await self.connect()
             if not success:
-                return False, "❌ Failed to establish SSH connection"
+                return None
         
+        started = time.monotonic()
         try:
             result = await asyncio.wait_for(
-                self.single_connection.run(command, check=True),
+                self.single_connection.run(command, errors='replace'),
                 timeout=timeout
             )
+        except Exception as e:
+            logger.warning(f"Internal command failed: {e}")
+            return None
+        finally:
+            self._profile('run_internal', started)
+        
+        return result.stdout
+    
+    async def execute_command(self, command: str, timeout: int = 30, user_id: Optional[int] = None,
+                              command_id: Optional[str] = None,
+                              output_limit: Optional[int] = None) -> Tuple[bool, str]:
+        """Execute single command"""
+        return await self._execute_command(command, command, timeout, user_id, command_id, output_limit)
+    
+    async def _execute_command(self, command: str, remote_command: str, timeout: int,
+                               user_id: Optional[int], command_id: Optional[str] = None,
+                               output_limit: Optional[int] = None) -> Tuple[bool, str]:
+        """Run remote_command on the shared connection, audit it as command"""
+        allowed, reason = self._check_policy(command, user_id)
+        if not allowed:
+            return False, reason
+        
+        if not self.single_connection:
+            success = await self.connect()
+            if not success:
+                return False, "❌ Failed to establish SSH connection"
+        
+        connection = self.single_connection
+        entry = self._register_command(command_id, user_id, command)
+        started = time.monotonic()
+        exit_status = None
+        output_size = 0
+        pid = None
+        
+        try:
+            self._check_cancelled(entry)
             
-            output = result.stdout
-            if result.stderr:
-                output += f"\nStderr: {result.stderr}"
+            # The remote shell reports its PID first so the command can be killed later
+            process = await connection.create_process(f"echo $$; {remote_command}", encoding=None)
+            pid = (await process.stdout.readline()).decode(errors='replace').strip()
+            
+            stdout = self._new_capture(output_limit)
+            stderr = self._new_capture(output_limit)
+            
+            async def stop_on_limit():
+                await self._kill_remote(connection, pid, include_parent=True)
+            
+            wait_task = asyncio.ensure_future(self._capture_process(process, stdout, stderr, stop_on_limit))
+            try:
+                await self._wait_unless_cancelled(entry, wait_task, timeout)
+            except (asyncio.TimeoutError, CommandCancelled):
+                wait_task.cancel()
+                await self._kill_remote(connection, pid, include_parent=True)
+                process.close()
+                raise
+            
+            exit_status = wait_task.result()
+            output = stdout.text()
+            if stderr.total:
+                output += f"\nStderr: {stderr.text()}"
+            output_size = stdout.total + stderr.total
+            
+            if exit_status != 0:
+                return False, f"❌ Command failed (exit code {exit_status}): {output.strip()}"
                 
             return True, output.strip()
             
+        except asyncio.TimeoutError:
+            return False, f"❌ Command timed out after {timeout} seconds"
+        except CommandCancelled:
+            return False, f"⛔ Command cancelled after {time.monotonic() - entry['started']:.1f} seconds"
         except Exception as e:
             return False, f"❌ Error: {e}"
+        finally:
+            self._unregister_command(command_id, entry)
+            audit_log.record(user_id, config.SSH_HOST, command, None, exit_status,
+                             time.monotonic() - started, output_size)
+            self._profile('execute_command', started)
     
     async def create_session(self, user_id: int) -> bool:
-        """Create stateful session for user"""
+        """Create stateful session for user backed by a long-lived shell"""
+        started = time.monotonic()
         try:
             if user_id in self.sessions:
                 await self.close_session(user_id)
             
-            conn_args = {
-                'host': config.SSH_HOST,
-                'port': config.SSH_PORT,
-                'username': config.SSH_USERNAME,
-            }
+            connection = await asyncssh.connect(**self._get_connection_args())
             
-            if config.SSH_PASSWORD:
-                conn_args['password'] = config.SSH_PASSWORD
-            elif config.SSH_KEY_PATH:
-                conn_args['client_keys'] = [config.SSH_KEY_PATH]
-            
-            connection = await asyncssh.connect(**conn_args)
-            
-            # Initialize session with home directory
-            result = await connection.run("pwd", check=True)
-            current_dir = result.stdout.strip()
+            # No PTY: the shell reads commands from stdin without echo or prompts,
+            # so everything on stdout is command output or our own markers
+            shell = await connection.create_process(
+                stderr=asyncssh.STDOUT,
+                encoding=None
+            )
             
-            self.sessions[user_id] = {
+            session = {
                 'connection': connection,
-                'current_directory': current_dir,
+                'shell': shell,
+                'stdin': shell.stdin,
+                'stdout': shell.stdout,
+                'current_directory': '~',
+                'pid': None,
                 'lock': asyncio.Lock()
             }
             
-            logger.info(f"Stateful SSH session created for user {user_id}, starting in: {current_dir}")
+            # Let aliases defined by the user expand in later commands. The first
+            # framed command also skips anything login scripts printed on startup.
+            try:
+                _, session['pid'] = await asyncio.wait_for(
+                    self._run_in_shell(session, "shopt -s expand_aliases 2>/dev/null; echo $$"),
+                    timeout=30
+                )
+            except BaseException:
+                connection.close()
+                raise
+            
+            self.sessions[user_id] = session
+            
+            logger.info(f"Stateful SSH session created for user {user_id}, starting in: {session['current_directory']}")
             return True
             
         except Exception as e:
             logger.error(f"Session creation failed for user {user_id}: {e}")
             return False
+        finally:
+            self._profile('create_session', started)
     
-    async def execute_in_session(self, user_id: int, command: str, timeout: int = 30) -> Tuple[bool, str]:
-        """Execute command with state preservation"""
+    async def execute_in_session(self, user_id: int, command: str, timeout: int = 30,
+                                 command_id: Optional[str] = None,
+                                 output_limit: Optional[int] = None) -> Tuple[bool, str]:
+        """Execute command in the user's persistent shell"""
+        return await self._execute_in_session(user_id, command, command, timeout, command_id, output_limit)
+    
+    async def _execute_in_session(self, user_id: int, command: str, remote_command: str,
+                                  timeout: int, command_id: Optional[str] = None,
+                                  output_limit: Optional[int] = None) -> Tuple[bool, str]:
+        """Run remote_command in the session shell, audit it as command"""
+        allowed, reason = self._check_policy(command, user_id)
+        if not allowed:
+            return False, reason
+        
         if user_id not in self.sessions:
             success = await self.create_session(user_id)
             if not success:
                 return False, "❌ Failed to create SSH session"
         
         session = self.sessions[user_id]
+        entry = self._register_command(command_id, user_id, command)
         
+        waiting = time.monotonic()
         async with session['lock']:
+            started = time.monotonic()
+            self._profile('session_lock_wait', waiting)
+            cwd = session['current_directory']
+            exit_status = None
+            output_size = 0
+            interrupted_note = ""
+            
             try:
-                # Handle cd commands specially
-                if command.strip().startswith('cd '):
-                    return await self._handle_cd_command(session, command, timeout)
-                else:
-                    # For other commands, execute in current directory
-                    full_command = f"cd '{session['current_directory']}' && {command}"
-                    result = await asyncio.wait_for(
-                        session['connection'].run(full_command, check=True),
-                        timeout=timeout
-                    )
-                    
-                    output = result.stdout
-                    if result.stderr:
-                        output += f"\nStderr: {result.stderr}"
-                    
-                    return True, output.strip()
+                self._check_cancelled(entry)
+                
+                capture = self._new_capture(output_limit)
+                read_task = asyncio.ensure_future(self._run_in_shell(session, remote_command, capture))
+                try:
+                    await self._wait_unless_cancelled(entry, read_task, timeout)
+                except (asyncio.TimeoutError, CommandCancelled):
+                    if not await self._interrupt_session(user_id, session, read_task):
+                        interrupted_note = ", session was reset"
+                    raise
+                
+                exit_status, output = read_task.result()
+                output_size = capture.total
+                
+                if exit_status != 0:
+                    return False, f"❌ Command failed (exit code {exit_status}): {output}"
+                
+                if not output and command.split()[:1] == ['cd']:
+                    return True, f"Changed directory to: {session['current_directory']}"
+                
+                return True, output
                     
             except asyncio.TimeoutError:
-                return False, f"❌ Command timed out after {timeout} seconds"
-            except asyncssh.ProcessError as e:
-                return False, f"❌ Command failed: {e.stderr}"
+                return False, f"❌ Command timed out after {timeout} seconds{interrupted_note}"
+            except CommandCancelled:
+                return False, f"⛔ Command cancelled after {time.monotonic() - entry['started']:.1f} seconds{interrupted_note}"
+            except asyncio.IncompleteReadError:
+                await self.close_session(user_id)
+                return False, "❌ Shell session ended, a new one will be started on the next command"
             except Exception as e:
                 return False, f"❌ Error: {e}"
+            finally:
+                self._unregister_command(command_id, entry)
+                audit_log.record(user_id, config.SSH_HOST, command, cwd, exit_status,
+                                 time.monotonic() - started, output_size)
+                self._profile('execute_in_session', started)
+    
+    async def _interrupt_session(self, user_id: int, session: dict, read_task: asyncio.Future) -> bool:
+        """Stop the command running in a session shell, return False if the session had to go
+        
+        The command's processes are children of the shell: TERM them, then KILL
+        them, and wait for the shell to print the command's sentinel so the
+        stream is in sync again. Shell builtins and loops can't be signalled
+        this way, so if the sentinel never comes the whole session is dropped.
+        """
+        for signal_name in ('TERM', 'KILL'):
+            await self._kill_remote(session['connection'], session['pid'], signal_name=signal_name)
+            done, _ = await asyncio.wait({read_task}, timeout=1.0)
+            if done:
+                if read_task.exception() is None:
+                    return True
+                break
+        
+        read_task.cancel()
+        await self.close_session(user_id)
+        return False
     
-    async def _handle_cd_command(self, session: dict, command: str, timeout: int) -> Tuple[bool, str]:
-        """Handle cd command and update current directory"""
+    async def _kill_remote(self, connection: asyncssh.SSHClientConnection, pid: Optional[str],
+                           signal_name: str = 'TERM', include_parent: bool = False):
+        """Signal the children of a remote shell over a separate channel"""
+        if not pid or not pid.isdigit():
+            return
+        
+        command = f"pkill -{signal_name} -P {pid}"
+        if include_parent:
+            command += f"; kill -{signal_name} {pid}"
+        
         try:
-            parts = command.strip().split()
-            if len(parts) < 2:
-                return False, "❌ Invalid cd command: no directory specified"
-            
-            target_dir = parts[1]
-            
-            # If relative path, resolve it relative to current directory
-            if not target_dir.startswith('/'):
-                if session['current_directory'] == '/':
-                    target_dir = '/' + target_dir
-                else:
-                    target_dir = session['current_directory'] + '/' + target_dir
-            
-            # Normalize path (resolve .. and .)
-            target_dir = os.path.normpath(target_dir)
-            
-            # Check if directory exists and get absolute path
-            result = await asyncio.wait_for(
-                session['connection'].run(f"cd '{target_dir}' && pwd", check=True),
+            await asyncio.wait_for(connection.run(command), timeout=5)
+        except Exception as e:
+            logger.warning(f"Failed to signal remote process {pid}: {e}")
+    
+    def _check_policy(self, command: str, user_id: Optional[int]) -> Tuple[bool, str]:
+        """Every execution path goes through the command policy, whatever the caller checked"""
+        allowed, reason = command_policy.check(command, user_id, config.SSH_HOST)
+        if not allowed:
+            logger.warning(f"Command denied for user {user_id}: {command!r} ({reason})")
+        return allowed, reason
+    
+    def _profile(self, name: str, started: float):
+        """Report an SSH call to the profiler, a single attribute check when it is off"""
+        if profiler.active:
+            profiler.record('ssh', name, time.monotonic() - started)
+    
+    def new_command_id(self) -> str:
+        """Short id for a command that is about to run, fits into callback data"""
+        return uuid.uuid4().hex[:12]
+    
+    def _register_command(self, command_id: Optional[str], user_id: Optional[int], command: str) -> dict:
+        """Track a running command, several commands (macro steps) may share an id"""
+        if command_id is None:
+            return {'cancelled': asyncio.Event(), 'started': time.monotonic()}
+        
+        entry = self.running.get(command_id)
+        if entry is None:
+            entry = self.running[command_id] = {
+                'user_id': user_id,
+                'command': command,
+                'started': time.monotonic(),
+                'cancelled': asyncio.Event(),
+                'active': 0
+            }
+        entry['active'] += 1
+        return entry
+    
+    def _unregister_command(self, command_id: Optional[str], entry: dict):
+        if command_id is None:
+            return
+        
+        entry['active'] -= 1
+        if entry['active'] <= 0 and self.running.get(command_id) is entry:
+            del self.running[command_id]
+    
+    def _check_cancelled(self, entry: dict):
+        if entry['cancelled'].is_set():
+            raise CommandCancelled()
+    
+    async def _wait_unless_cancelled(self, entry: dict, task: asyncio.Future, timeout: float):
+        """Wait for task without cancelling it, raise on timeout or user cancel"""
+        cancel_task = asyncio.ensure_future(entry['cancelled'].wait())
+        try:
+            done, _ = await asyncio.wait(
+                {task, cancel_task},
+                timeout=timeout,
+                return_when=asyncio.FIRST_COMPLETED
+            )
+        finally:
+            cancel_task.cancel()
+        
+        if task in done:
+            return
+        if cancel_task in done:
+            raise CommandCancelled()
+        raise asyncio.TimeoutError()
+    
+    def cancel_command(self, command_id: str, user_id: int) -> Tuple[bool, str]:
+        """Cancel a running command started by this user"""
+        entry = self.running.get(command_id)
+        if entry is None:
+            return False, "Command already finished"
+        if entry['user_id'] != user_id:
+            return False, "This command belongs to another user"
+        
+        entry['cancelled'].set()
+        return True, f"⛔ Cancelling after {time.monotonic() - entry['started']:.1f} seconds"
+    
+    async def _run_in_shell(self, session: dict, command: str,
+                            capture: Optional[OutputCapture] = None) -> Tuple[int, str]:
+        """Run command in the session shell and read output up to its sentinel
+        
+        The command is eval'd in the shell itself so cd, export, source, aliases
+        and functions persist. A unique marker followed by the exit status and
+        working directory is printed afterwards, which tells exactly where the
+        output ends without any polling. Output goes through capture, once it
+        is over the limit the command is stopped and the rest is drained.
+        """
+        if capture is None:
+            capture = self._new_capture()
+        
+        marker = f"__TGBOT_{uuid.uuid4().hex}__".encode()
+        
+        session['stdin'].write(
+            f"eval {shlex.quote(command)} </dev/null\n"
+            f"printf '\\n%s %d %s\\n' '{marker.decode()}' \"$?\" \"$PWD\"\n".encode()
+        )
+        
+        # The marker can be split between chunks, hold back enough bytes to find it
+        keep = len(marker) - 1
+        pending = b''
+        while True:
+            chunk = await session['stdout'].read(READ_CHUNK_SIZE)
+            if not chunk:
+                raise asyncio.IncompleteReadError(pending, None)
+            pending += chunk
+            index = pending.find(marker)
+            if index >= 0:
+                break
+            if capture.feed(pending[:-keep]):
+                await self._kill_remote(session['connection'], session['pid'])
+            pending = pending[-keep:]
+        
+        capture.feed(pending[:index])
+        status_line = pending[index + len(marker):]
+        while b'\n' not in status_line:
+            line = await session['stdout'].readline()
+            if not line:
+                raise asyncio.IncompleteReadError(status_line, None)
+            status_line += line
+        
+        exit_status, _, current_dir = status_line.split(b'\n', 1)[0].decode(errors='replace').strip().partition(' ')
+        session['current_directory'] = current_dir
+        
+        return int(exit_status), capture.text().strip()
+    
+    def _new_capture(self, output_limit: Optional[int] = None) -> OutputCapture:
+        """Bounded output buffer, output_limit overrides OUTPUT_LIMIT_BYTES for one command"""
+        return OutputCapture(
+            config.OUTPUT_HEAD_BYTES,
+            config.OUTPUT_TAIL_BYTES,
+            config.OUTPUT_LIMIT_BYTES if output_limit is None else output_limit
+        )
+    
+    async def _capture_process(self, process: asyncssh.SSHClientProcess, stdout: OutputCapture,
+                               stderr: OutputCapture, on_limit) -> int:
+        """Read both output streams into bounded buffers, return the exit status"""
+        async def pump(reader: asyncssh.SSHReader, capture: OutputCapture):
+            while True:
+                chunk = await reader.read(READ_CHUNK_SIZE)
+                if not chunk:
+                    return
+                if capture.feed(chunk):
+                    await on_limit()
+        
+        await asyncio.gather(pump(process.stdout, stdout), pump(process.stderr, stderr))
+        return (await process.wait()).exit_status
+    
+    async def execute_large_output(self, user_id: int, command: str, timeout: int = 300,
+                                   use_session: bool = True,
+                                   command_id: Optional[str] = None) -> Tuple[bool, str, Optional[str]]:
+        """Execute command expecting large output
+        
+        Runs in the user's terminal session if there is one (and use_session
+        is set), otherwise on the shared connection. Output up to LARGE_OUTPUT_THRESHOLD bytes comes back
+        as text. Larger output is gzipped on the server and streamed straight
+        into a local .txt.gz file, whose path is returned as the third item;
+        the caller is responsible for deleting it.
+        """
+        marker = f"__TGBOT_GZ_{uuid.uuid4().hex}__"
+        
+        if use_session and user_id in self.sessions:
+            remote_command = self._wrap_large_output(command, marker)
+            success, output = await self._execute_in_session(user_id, command, remote_command, timeout, command_id)
+            connection = self.sessions.get(user_id, {}).get('connection')
+        else:
+            remote_command = self._wrap_large_output(command, marker, in_session=False)
+            success, output = await self._execute_command(command, remote_command, timeout, user_id, command_id)
+            connection = self.single_connection
+        
+        match = re.search(re.escape(marker) + r' (\d+) (\S+)', output)
+        if not match:
+            return success, output, None
+        
+        size, remote_path = int(match.group(1)), match.group(2)
+        
+        try:
+            local_path = await asyncio.wait_for(
+                self._download_output(connection, remote_path),
                 timeout=timeout
             )
-            
-            new_dir = result.stdout.strip()
-            session['current_directory'] = new_dir
-            
-            return True, f"Changed directory to: {new_dir}"
-            
-        except asyncssh.ProcessError as e:
-            return False, f"❌ Directory not found or inaccessible: {e.stderr}"
         except Exception as e:
-            return False, f"❌ Error changing directory: {e}"
+            logger.error(f"Failed to download compressed output {remote_path}: {e}")
+            # Best effort, the remote copy is only deleted after a complete download
+            await self.run_internal(f"rm -f {shlex.quote(remote_path)}")
+            return False, f"❌ Failed to download output ({size} bytes): {e}", None
+        
+        summary = f"📦 {size} bytes of output, sent as a {os.path.getsize(local_path)} byte gzip attachment"
+        return success, output[:match.start()] + summary + output[match.end():], local_path
+    
+    def _wrap_large_output(self, command: str, marker: str, in_session: bool = True) -> str:
+        """Shell snippet that spools output to a remote temp file and gzips it if large
+        
+        Keeps the command's exit status and, when eval'd in a session shell,
+        leaves no variables behind. Outside a session, cancel and timeout kill
+        the shell itself before it gets to its own rm, so traps delete the
+        temp files; the gzip file is left for the download once announced.
+        """
+        cleanup = keep_gzip = ""
+        if not in_session:
+            # Paths are expanded when the trap is set, the variables are unset at the end
+            cleanup = 'trap "rm -f \\"$__tgbot_f\\" \\"$__tgbot_f.gz\\"" EXIT; trap "exit 143" HUP INT TERM; '
+            keep_gzip = 'trap "rm -f \\"$__tgbot_f\\"" EXIT; '
+        return (
+            f"if __tgbot_f=$(mktemp); then {cleanup}"
+            f"eval {shlex.quote(command)} >\"$__tgbot_f\" 2>&1 </dev/null; __tgbot_rc=$?; "
+            f"__tgbot_n=$(wc -c <\"$__tgbot_f\"); "
+            f"if [ \"$__tgbot_n\" -gt {config.LARGE_OUTPUT_THRESHOLD} ] && gzip -c \"$__tgbot_f\" >\"$__tgbot_f.gz\"; "
+            f"then printf '%s %s %s\\n' '{marker}' \"$__tgbot_n\" \"$__tgbot_f.gz\"; {keep_gzip}"
+            f"else cat \"$__tgbot_f\"; fi; "
+            f"rm -f \"$__tgbot_f\"; "
+            f"eval \"unset __tgbot_f __tgbot_n __tgbot_rc; (exit $__tgbot_rc)\"; "
+            f"else (exit 1); fi"
+        )
+    
+    async def _download_output(self, connection: asyncssh.SSHClientConnection, remote_path: str) -> str:
+        """Stream a remote gzip file into a local temp file and delete the remote copy"""
+        fd, local_path = tempfile.mkstemp(prefix='tgbot-output-', suffix='.txt.gz')
+        os.close(fd)
+        
+        started = time.monotonic()
+        try:
+            quoted = shlex.quote(remote_path)
+            await connection.run(f"cat {quoted} && rm -f {quoted}", stdout=local_path, encoding=None, check=True)
+        except BaseException:
+            os.remove(local_path)
+            raise
+        finally:
+            self._profile('download_output', started)
+        
+        return local_path
     
     async def get_current_directory(self, user_id: int) -> Tuple[bool, str]:
         """Get current working directory"""
@@ -0,0 +1,55 @@
+import asyncio
+from unittest import mock
+from aiogram.types import CallbackQuery, User
+from middlewares.access import AccessMiddleware
+
+def make_middleware(rate: float = 100.0, burst: int = 100, duplicate_window: float = 2.0) -> AccessMiddleware:
+    return AccessMiddleware(frozenset({1}), rate=rate, burst=burst, duplicate_window=duplicate_window)
+
+def press(middleware: AccessMiddleware, data: str, now: float, user_id: int = 1) -> bool:
+    """Send one button press through the middleware, True if the handler ran"""
+    user = User(id=user_id, is_bot=False, first_name='admin')
+    event = CallbackQuery(id='x', from_user=user, chat_instance='c', data=data)
+    handler = mock.AsyncMock(return_value=True)
+    with mock.patch('time.monotonic', return_value=now):
+        asyncio.run(middleware(handler, event, {'event_from_user': user}))
+    return handler.await_count == 1
+
+def test_unknown_user_is_dropped():
+    middleware = make_middleware()
+
+    assert not press(middleware, "quick_cmd:memory", 0.0, user_id=2)
+    assert middleware.dropped['unauthorized'] == 1
+
+def test_dropped_duplicate_does_not_extend_the_window():
+    middleware = make_middleware()
+
+    assert press(middleware, "quick_cmd:memory", 0.0)
+    assert not press(middleware, "quick_cmd:memory", 1.5)
+    # The window still counts from the accepted press at 0.0
+    assert press(middleware, "quick_cmd:memory", 2.5)
+    assert not press(middleware, "quick_cmd:memory", 3.0)
+    assert middleware.dropped['duplicate'] == 2
+
+def test_rate_limited_request_does_not_open_a_window():
+    middleware = make_middleware(rate=1.0, burst=1)
+
+    assert press(middleware, "quick_cmd:memory", 0.0)
+    assert not press(middleware, "quick_cmd:disk", 0.1)
+    assert press(middleware, "quick_cmd:disk", 1.2)
+    assert middleware.dropped == {'rate_limited': 1}
+
+def test_token_bucket_refills_over_time():
+    middleware = make_middleware(rate=1.0, burst=2)
+
+    assert [press(middleware, f"quick_cmd:{n}", 0.0) for n in range(3)] == [True, True, False]
+    assert press(middleware, "quick_cmd:3", 1.0)
+    assert not press(middleware, "quick_cmd:4", 1.0)
+
+def test_cancel_gets_through_after_a_burst():
+    middleware = make_middleware(rate=1.0, burst=1)
+
+    assert press(middleware, "quick_cmd:update", 0.0)
+    assert not press(middleware, "quick_cmd:memory", 0.1)
+    assert press(middleware, "cancel_cmd:1", 0.2)
+    assert press(middleware, "cancel_cmd:1", 0.3)
@@ -0,0 +1,71 @@
+import json
+from unittest import mock
+from services.audit import AuditLog
+
+def make_record(ts: float, user_id, command: str = 'ls') -> dict:
+    return {'ts': ts, 'time': '2026-01-01T00:00:00', 'user_id': user_id, 'host': 'h',
+            'command': command, 'cwd': None, 'exit_status': 0, 'duration': 0.1, 'output_size': 0}
+
+def write_lines(path, *lines: str):
+    with open(path, 'a', encoding='utf-8') as file:
+        file.write(''.join(lines))
+
+def record_line(ts: float, user_id, command: str = 'ls') -> str:
+    return json.dumps(make_record(ts, user_id, command)) + '\n'
+
+def timestamps(records: list) -> list:
+    return [record['ts'] for record in records]
+
+def test_interleaved_worker_files_are_merged(tmp_path):
+    write_lines(tmp_path / 'audit-w0-20260101T000000000.jsonl', *(record_line(ts, 1) for ts in (1.0, 3.0, 5.0, 7.0)))
+    write_lines(tmp_path / 'audit-w1-20260101T000000000.jsonl', *(record_line(ts, 2) for ts in (2.0, 4.0, 6.0, 8.0)))
+    audit = AuditLog(str(tmp_path))
+
+    assert timestamps(audit.query(limit=5)) == [8.0, 7.0, 6.0, 5.0, 4.0]
+
+def test_user_since_and_limit_filters(tmp_path):
+    write_lines(tmp_path / 'audit-20260101T000000000.jsonl',
+                *(record_line(float(ts), ts % 3) for ts in range(1, 31)))
+    audit = AuditLog(str(tmp_path))
+
+    assert timestamps(audit.query(user_id=1, limit=3)) == [28.0, 25.0, 22.0]
+    assert timestamps(audit.query(user_id=2, since=20.0, limit=10)) == [29.0, 26.0, 23.0, 20.0]
+    assert timestamps(audit.query(since=28.0)) == [30.0, 29.0, 28.0]
+    assert audit.query(user_id=99) == []
+
+def test_partial_trailing_line_is_indexed_once_complete(tmp_path):
+    path = tmp_path / 'audit-20260101T000000000.jsonl'
+    line = record_line(2.0, 1)
+    write_lines(path, record_line(1.0, 1), line[:20])
+    audit = AuditLog(str(tmp_path))
+
+    assert timestamps(audit.query()) == [1.0]
+
+    write_lines(path, line[20:], record_line(3.0, 1))
+    assert timestamps(audit.query()) == [3.0, 2.0, 1.0]
+
+def test_foreign_lines_are_skipped(tmp_path):
+    # Records written with another key order still count, anything else is ignored
+    reordered = json.dumps({'user_id': 1, 'ts': 2.0, 'command': 'reordered'}) + '\n'
+    write_lines(tmp_path / 'audit-20260101T000000000.jsonl',
+                record_line(1.0, 1), 'not json\n', '{"other": 1}\n', reordered, '\n', record_line(3.0, None))
+    audit = AuditLog(str(tmp_path))
+
+    assert timestamps(audit.query()) == [3.0, 2.0, 1.0]
+    assert [record['command'] for record in audit.query(user_id=1)] == ['reordered', 'ls']
+
+def test_query_stops_before_older_blocks(tmp_path):
+    write_lines(tmp_path / 'audit-20260101T000000000.jsonl',
+                *(record_line(float(ts), 1, 'x' * 100) for ts in range(200)))
+    audit = AuditLog(str(tmp_path))
+
+    with mock.patch('services.audit.INDEX_BLOCK_BYTES', 1024):
+        with mock.patch.object(audit, '_read_block', wraps=audit._read_block) as read_block:
+            records = audit.query(limit=3)
+
+    assert timestamps(records) == [199.0, 198.0, 197.0]
+    assert len(audit._files) == 1
+    blocks = next(iter(audit._files.values())).blocks
+    assert len(blocks) > 10
+    # The newest block holds enough records; one more read at most to confirm
+    assert read_block.call_count <= 2
@@ -0,0 +1,51 @@
+from services.output_capture import OutputCapture
+
+def feed_all(capture: OutputCapture, *chunks: bytes) -> list:
+    return [capture.feed(chunk) for chunk in chunks]
+
+def test_small_output_is_kept_whole():
+    capture = OutputCapture(4, 8)
+    feed_all(capture, b"ab", b"cdef", b"gh")
+
+    assert capture.omitted == 0
+    assert capture.text() == "abcdefgh"
+
+def test_multibyte_character_across_head_and_tail():
+    capture = OutputCapture(2, 8)
+    capture.feed("aébc".encode())
+
+    assert capture.text() == "aébc"
+
+def test_tail_ring_buffer_wraps_around():
+    capture = OutputCapture(2, 4)
+    feed_all(capture, b"HH", b"abc", b"de", b"fgh")
+
+    assert capture.omitted == 4
+    assert capture.text() == "HH\n\n… 4 bytes omitted …\n\nefgh"
+
+def test_chunk_larger_than_tail():
+    capture = OutputCapture(2, 4)
+    feed_all(capture, b"HHxy", b"0123456789")
+
+    assert capture.total == 14
+    assert capture.omitted == 8
+    assert capture.text().endswith("\n\n6789")
+
+def test_no_tail_buffer_only_counts():
+    capture = OutputCapture(3, 0)
+    capture.feed(b"abcdef")
+
+    assert capture.text() == "abc\n\n… 3 bytes omitted …\n\n"
+
+def test_limit_crossing_is_reported_once():
+    capture = OutputCapture(4, 4, limit=10)
+
+    assert feed_all(capture, b"12345", b"67890", b"x", b"yz") == [False, False, True, False]
+    assert capture.limit_reached
+    assert capture.text().endswith("⚠️ Output exceeded 10 bytes, the command was stopped")
+
+def test_without_limit_output_is_drained():
+    capture = OutputCapture(4, 4)
+
+    assert not any(feed_all(capture, *[b"x" * 1000] * 100))
+    assert capture.total == 100000
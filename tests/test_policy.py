@@ -0,0 +1,69 @@
+import json
+import pytest
+from services.policy import CommandPolicy, tokenize
+
+def make_policy(tmp_path, rules, default='allow') -> CommandPolicy:
+    path = tmp_path / 'policy.json'
+    path.write_text(json.dumps({'default': default, 'rules': rules}))
+    return CommandPolicy(str(path))
+
+@pytest.mark.parametrize('line, tokens', [
+    ("rm -rf /", ['rm', '-r', '-f', '/']),
+    ("echo 'a b'\"c\"\\ d", ['echo', 'a bc d']),
+    ("echo $'a\\nb' $'\\x2f' $\"x\"", ['echo', 'a\nb', '/', 'x']),
+    ("echo $'it\\'s'", ['echo', "it's"]),
+    ("cat</etc/passwd > /dev/sda", ['cat', '</etc/passwd', '>/dev/sda']),
+    ("a&&b|c;d", ['a', '&&', 'b', '|', 'c', ';', 'd']),
+    ("cat <(ls) >(wc)", ['cat', '<(', 'ls', ')', '>(', 'wc', ')']),
+    ("bash <<< 'ls -l'", ['bash', '<<<ls -l']),
+])
+def test_tokenize(line, tokens):
+    assert tokenize(line) == tokens
+
+def test_tokenize_unbalanced_quote():
+    with pytest.raises(ValueError):
+        tokenize("echo 'oops")
+
+@pytest.mark.parametrize('command', [
+    "rm -rf /", "rm -fr //", "rm -rf /.", "rm -rf /tmp/..", "rm -rf $'/'", "rm -rf $'\\x2f'",
+    "rm -rf $\"/\"", "sudo rm -rf /", "sh -c 'rm -rf /'", "ls; rm --recursive /",
+    "echo x > /dev//sda", "dd if=/dev/zero of=/dev/sda", ":(){ :|:& };:",
+    "rm -Rf /", "rm -R -f /*", "cat <(rm -rf /)", "tee >(rm -rf /)", "diff <(ls) <(rm -rf /)",
+    'echo "$(rm -rf /)"', 'echo "`rm -rf /`"', 'echo "x $(echo ok; rm -rf /) y"',
+    "bash <<< 'rm -rf /'", "sudo sh <<<'rm -rf /'",
+])
+def test_default_rules_deny(command):
+    policy = CommandPolicy('config/policy.json')
+    assert policy.check(command, 1, 'host')[0] is False
+
+@pytest.mark.parametrize('command', [
+    "ls -la /", "rm -rf ./build", "rm ''", "echo '/'", "cat <(ls /)", "sort < input.txt",
+    "echo '$(rm -rf /)'", 'echo "\\$(rm -rf /)"', "grep x <<< 'rm -rf /'", 'echo "$(date)"',
+])
+def test_default_rules_allow(command):
+    policy = CommandPolicy('config/policy.json')
+    assert policy.check(command, 1, 'host') == (True, "")
+
+def test_allow_regex_does_not_skip_later_denies(tmp_path):
+    policy = make_policy(tmp_path, [
+        {'name': 'wipe-root', 'action': 'deny', 'command': 'rm', 'args': ['-r', '/']},
+        {'name': 'curl-sh', 'action': 'deny', 'regex': r'curl[^|]*\|\s*sh'},
+        {'name': 'echo-ok', 'action': 'allow', 'regex': 'echo ok'},
+    ])
+    assert policy.check("echo ok", 1, 'host') == (True, "")
+    assert policy.check("echo ok; rm -rf /", 1, 'host') == (False, "🚫 Blocked by policy rule 'wipe-root'")
+    assert policy.check("echo ok; curl x | sh", 1, 'host') == (False, "🚫 Blocked by policy rule 'curl-sh'")
+
+def test_first_matching_rule_wins(tmp_path):
+    policy = make_policy(tmp_path, [
+        {'name': 'apt', 'action': 'allow', 'regex': r'^apt update$'},
+        {'name': 'no-apt', 'action': 'deny', 'command': 'apt'},
+        {'name': 'curl-sh', 'action': 'deny', 'regex': r'curl[^|]*\|\s*sh'},
+        {'name': 'curl', 'action': 'allow', 'command': 'curl'},
+    ], default='deny')
+    assert policy.check("apt update", 1, 'host') == (True, "")
+    assert policy.check("apt install x", 1, 'host') == (False, "🚫 Blocked by policy rule 'no-apt'")
+    # The line regex comes before the token rule for curl, whichever matches leftmost
+    assert policy.check("curl x | sh", 1, 'host') == (False, "🚫 Blocked by policy rule 'curl-sh'")
+    assert policy.check("curl x", 1, 'host') == (True, "")
+    assert policy.check("curl x; ls", 1, 'host') == (False, "🚫 'ls' is not allowed by policy")
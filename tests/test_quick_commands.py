@@ -0,0 +1,55 @@
+import asyncio
+from unittest import mock
+from handlers import commands
+from services.ssh_client import ssh_client
+
+def make_callback(data: str) -> mock.MagicMock:
+    callback = mock.MagicMock()
+    callback.data = data
+    callback.from_user.id = 1
+    callback.answer = mock.AsyncMock()
+    callback.message.edit_reply_markup = mock.AsyncMock()
+    callback.message.answer = mock.AsyncMock(return_value=mock.AsyncMock())
+    return callback
+
+def run_callback(data: str, execute: mock.AsyncMock) -> mock.MagicMock:
+    callback = make_callback(data)
+    with mock.patch.object(ssh_client, 'execute_command', execute):
+        asyncio.run(commands.handle_quick_command(callback))
+    return callback
+
+def test_quick_command_button_runs_the_command():
+    execute = mock.AsyncMock(return_value=(True, "Mem: 1Gi"))
+    callback = run_callback("quick_cmd:memory", execute)
+
+    assert execute.await_args.args == ("free -h",)
+    assert "free \\-h" in callback.message.answer.await_args_list[-1].args[0]
+
+def test_macro_button_runs_every_step():
+    execute = mock.AsyncMock(return_value=(True, "ok"))
+    run_callback("quick_cmd:health", execute)
+
+    assert sorted(call.args[0] for call in execute.await_args_list) == sorted([
+        "uptime", "free -h", "df -h /",
+        "systemctl list-units --type=service --state=failed --no-legend",
+    ])
+
+def test_unknown_quick_command_is_reported():
+    execute = mock.AsyncMock()
+    callback = run_callback("quick_cmd:missing", execute)
+
+    execute.assert_not_awaited()
+    assert callback.answer.await_args.kwargs == {'show_alert': True}
+
+def test_entry_timeout_is_passed_to_every_step():
+    execute = mock.AsyncMock(return_value=(True, "ok"))
+    run_callback("quick_cmd:update", execute)
+
+    assert [call.args[0] for call in execute.await_args_list] == ["sudo apt update", "sudo apt upgrade -y"]
+    assert {call.kwargs['timeout'] for call in execute.await_args_list} == {1800}
+
+def test_default_timeout():
+    execute = mock.AsyncMock(return_value=(True, "ok"))
+    run_callback("quick_cmd:memory", execute)
+
+    assert execute.await_args.kwargs['timeout'] == 30
@@ -1,5 +1,11 @@
+import asyncio
+import os
 import re
-from typing import Optional
+from typing import Awaitable, Optional, TypeVar
+from aiogram import types
+from keyboards.main_menu import get_cancel_command_button
+
+T = TypeVar('T')
 
 def truncate_text(text: str, max_length: int = 4000) -> str:
     """Truncate text to maximum length for Telegram"""
@@ -19,4 +25,44 @@ def format_command_output(command: str, output: str, success: bool) -> str:
     formatted_output = escape_markdown(output)
     formatted_command = escape_markdown(command)
     
-    return f"""{status_icon} *Command executed:*\n {formatted_command} \n\n*Output:*\n{formatted_output}"""
\ No newline at end of file
+    return f"""{status_icon} *Command executed:*\n {formatted_command} \n\n*Output:*\n{formatted_output}"""
+
+async def answer_large_output(message: types.Message, command: str, output: str, success: bool,
+                              archive_path: Optional[str]):
+    """Reply with output as text, or as a .txt.gz attachment when it was compressed"""
+    if not archive_path:
+        await message.answer(
+            truncate_text(format_command_output(command, output, success)),
+            parse_mode="MarkdownV2"
+        )
+        return
+    
+    try:
+        name = re.sub(r'[^A-Za-z0-9_.-]+', '_', command.split()[0])[:32] or 'output'
+        status_icon = "✅" if success else "❌"
+        await message.answer_document(
+            types.FSInputFile(archive_path, filename=f"{name}.txt.gz"),
+            caption=truncate_text(f"{status_icon} $ {command}\n{output}", max_length=1000)
+        )
+    finally:
+        os.remove(archive_path)
+
+async def run_with_cancel_button(message: types.Message, command_id: str, awaitable: Awaitable[T],
+                                 delay: float = 1.0) -> T:
+    """Await a command, showing a cancel button only if it runs longer than delay"""
+    task = asyncio.ensure_future(awaitable)
+    done, _ = await asyncio.wait({task}, timeout=delay)
+    if done:
+        return task.result()
+    
+    status_msg = await message.answer(
+        "⏳ Still running...",
+        reply_markup=get_cancel_command_button(command_id)
+    )
+    try:
+        return await task
+    finally:
+        try:
+            await status_msg.delete()
+        except Exception:
+            pass
\ No newline at end of file